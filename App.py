@@ -1,116 +1,43 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-import sqlite3
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify
+import csv
+import hmac
+import io
+import json
 import os
-import sys
-from urllib.parse import urlparse
+
+import activities
+import assets
+import checkin
+import commands
+import counters
+import db
+import images
+import live
+import metrics
+import migrations
+import passwords
+import stamps
+import users
 
 app = Flask(__name__)
 app.secret_key = "change_this_to_a_secret_key"  # 用於 session 和 flash，正式環境請改成隨機值
+metrics.init_app(app)  # 最先注册，after_request 最后执行，计时包含其它钩子
+counters.init_app(app)
+db.init_app(app)
+images.init_app(app)
+assets.init_app(app)  # 放在 images 之后，指纹要包含生成的图片
+commands.init_app(app)  # flask --app App import-users / award-stamps / ...
 
-def get_db_connection():
-    # 检查是否有PostgreSQL连接字符串
-    database_url = os.environ.get('DATABASE_URL')
 
-    if database_url and database_url.startswith('postgres://'):
-        # Railway提供的PostgreSQL URL
-        try:
-            import psycopg2
-            from psycopg2.extras import RealDictCursor
-
-            # 转换PostgreSQL URL格式
-            url = urlparse(database_url)
-            conn = psycopg2.connect(
-                host=url.hostname,
-                port=url.port,
-                user=url.username,
-                password=url.password,
-                database=url.path[1:],  # 去掉开头的/
-                cursor_factory=RealDictCursor
-            )
-            return conn
-        except ImportError:
-            print("Warning: psycopg2 not installed, falling back to SQLite")
-            database_url = None
-
-    # 默认使用SQLite（本地开发或Railway未配置PostgreSQL时）
-    DB_PATH = os.path.join(os.path.dirname(__file__), "users.db")
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def init_db():
+    """把数据库迁移到最新版本；已是最新时只有一次版本查询。"""
+    return migrations.run()
 
 
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # 检查是否为PostgreSQL
-    is_postgres = hasattr(conn, 'get_dsn_parameters')
-
-    if is_postgres:
-        # PostgreSQL表创建
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                email TEXT UNIQUE,
-                phone TEXT,
-                password TEXT NOT NULL,
-                stamps TEXT DEFAULT ''
-            )
-            """
-        )
-    else:
-        # SQLite表创建
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT UNIQUE,
-                phone TEXT,
-                password TEXT NOT NULL,
-                stamps TEXT DEFAULT ''
-            )
-            """
-        )
-
-    # 数据库迁移逻辑（仅SQLite支持）
-    if not is_postgres:
-        # Migrate existing table to remove 'gender' and 'age' columns if present.
-        # SQLite doesn't support DROP COLUMN; create a new table and copy relevant data.
-        cur.execute("PRAGMA table_info(users)")
-        existing_columns = [r["name"] for r in cur.fetchall()]
-        desired_columns = {"id", "name", "email", "phone", "password", "stamps"}
-        # If there are extra columns (like gender/age) present in the actual table (e.g., from older schema),
-        # copy only the desired columns into a fresh table.
-        if set(existing_columns) != desired_columns:
-            try:
-                # Build select list for copy, using literals/defaults when a column is missing.
-                select_cols = []
-                for col in ["id", "name", "email", "phone", "password", "stamps"]:
-                    if col in existing_columns:
-                        select_cols.append(col)
-                    else:
-                        # Provide a sensible default for missing columns
-                        if col == "id":
-                            select_cols.append("NULL")
-                        elif col == "stamps":
-                            select_cols.append("'' AS stamps")
-                        else:
-                            select_cols.append("''")
-
-                cur.execute("CREATE TABLE IF NOT EXISTS users_new (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, email TEXT UNIQUE, phone TEXT, password TEXT NOT NULL, stamps TEXT DEFAULT '')")
-                cur.execute(
-                    "INSERT INTO users_new (id, name, email, phone, password, stamps) SELECT " + ", ".join(select_cols) + " FROM users"
-                )
-                cur.execute("DROP TABLE users")
-                cur.execute("ALTER TABLE users_new RENAME TO users")
-            except Exception:
-                # Fall back: if migration fails, ignore and keep the existing table as-is.
-                conn.rollback()
-    conn.commit()
-    conn.close()
+# gunicorn 的 master 已在 fork 前迁移过（gunicorn.conf.py），这里兜底其它入口；
+# AUTO_MIGRATE=0 时改为在发布流程里手动执行 python migrations.py
+if os.environ.get("AUTO_MIGRATE", "1") != "0":
+    init_db()
 
 
 @app.route("/", methods=["GET"])
@@ -118,6 +45,9 @@ def index():
     return render_template("index.html")
 
 
+BUSY_MESSAGE = "The server is busy. Please try again in a moment."
+
+
 @app.route("/register", methods=["POST"])
 def register():
     name = request.form.get("name", "").strip()
@@ -135,28 +65,22 @@ def register():
         flash("Password must be at least 6 characters long.", "danger")
         return redirect(url_for("index"))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        # 检查用户名是否已存在
-        cur.execute("SELECT id FROM users WHERE name = ?", (name,))
-        if cur.fetchone():
-            flash("This username is already taken. Please choose a different username.", "danger")
-            return redirect(url_for("index"))
-
-        cur.execute(
-            """
-            INSERT INTO users (name, email, phone, password)
-            VALUES (?, ?, ?, ?)
-            """,
-            (name, email, phone, password),
-        )
-        conn.commit()
-        flash("Account created. You can now sign in using your name or email.", "success")
-    except sqlite3.IntegrityError:
+        password_hash = passwords.hash_password(password)
+    except passwords.Overloaded:
+        flash(BUSY_MESSAGE, "danger")
+        return redirect(url_for("index"))
+
+    # 一次 INSERT 完成注册，重复由唯一索引判定，不再先查后插
+    conflict = users.create(name, email, phone, password_hash)
+    if conflict == "name":
+        flash("This username is already taken. Please choose a different username.", "danger")
+        return redirect(url_for("index"))
+    if conflict == "email":
         flash("This email is already registered. Please sign in or use another email.", "danger")
-    finally:
-        conn.close()
+    else:
+        db.commit()
+        flash("Account created. You can now sign in using your name or email.", "success")
 
     return redirect(url_for("index") + "#login")
 
@@ -170,33 +94,35 @@ def login():
         flash("Please enter account and password.", "danger")
         return redirect(url_for("index") + "?no_splash=1")
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     # 先檢查賬號是否存在
-    cur.execute(
-        """
-        SELECT * FROM users
-        WHERE name = ? OR email = ?
-        """,
-        (account, account),
-    )
-    user = cur.fetchone()
+    user = users.find_by_account(account)
     
     if not user:
-        conn.close()
         flash("Account not found. Please check your account name or email.", "danger")
         return redirect(url_for("index") + "?no_splash=1")
     
     # 賬號存在，檢查密碼
-    if user["password"] != password:
-        conn.close()
+    try:
+        ok, upgrade = passwords.verify(user["password"], password)
+    except passwords.Overloaded:
+        flash(BUSY_MESSAGE, "danger")
+        return redirect(url_for("index") + "?no_splash=1")
+    if not ok:
         flash("Incorrect password. Please try again.", "danger")
         return redirect(url_for("index") + "?no_splash=1")
-    
+
+    # 明文或旧参数的密码换成新哈希；繁忙时跳过，下次登录再换
+    if upgrade:
+        try:
+            if users.upgrade_password(user["id"], user["password"], passwords.hash_password(password)):
+                db.commit()
+        except passwords.Overloaded:
+            pass
+
     # 登錄成功
     session["user_name"] = user["name"]
+    session["user_id"] = user["id"]
     flash(f"Welcome, {user['name']}! Signed in successfully.", "success")
-    conn.close()
     return redirect(url_for("welcome"))
 
 
@@ -213,7 +139,8 @@ def activity():
     user_name = session.get("user_name")
     if not user_name:
         return redirect(url_for("index"))
-    return render_template("activity.html", user_name=user_name)
+    # 卡片片段在进程内缓存，命中时不查库
+    return render_template("activity.html", user_name=user_name, catalog=activities.get())
 
 
 @app.route("/apply", methods=["GET"])
@@ -224,51 +151,208 @@ def apply():
     return render_template("apply.html", user_name=user_name)
 
 
+def current_user_id():
+    # 旧版本登录的 session 里只有 user_name，第一次用到时补查一次 id
+    user_id = session.get("user_id")
+    if user_id is None and session.get("user_name"):
+        user = db.query_one("SELECT id FROM users WHERE name = ?", (session["user_name"],))
+        if user:
+            user_id = session["user_id"] = user["id"]
+    return user_id
+
+
+# write-behind 开启时，排队中的印章记在 session（cookie）里，随请求带到任意 worker；
+# 在 /estamp 上确认已经落库后再删掉
+QUEUED_STAMPS_KEY = "queued_stamps"
+
+
+def _remember_queued(idx):
+    queued = set(session.get(QUEUED_STAMPS_KEY, []))
+    if idx not in queued:
+        session[QUEUED_STAMPS_KEY] = sorted(queued | {idx})
+
+
+def _forget_queued(indexes):
+    queued = [idx for idx in session.get(QUEUED_STAMPS_KEY, []) if idx not in indexes]
+    if queued:
+        session[QUEUED_STAMPS_KEY] = queued
+    else:
+        session.pop(QUEUED_STAMPS_KEY, None)
+
+
+def _record_stamp(user_id, idx):
+    """为当前登录用户发章，排队时记进 session。返回值同 stamps.record()。"""
+    awarded = stamps.record(user_id, idx)
+    if awarded is None:
+        _remember_queued(idx)
+    return awarded
+
+
 @app.route("/estamp", methods=["GET"])
 def estamp():
     user_name = session.get("user_name")
     if not user_name:
         return redirect(url_for("index"))
     
-    # 获取用户已收集的stamps
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT stamps FROM users WHERE name = ?", (user_name,))
-    user = cur.fetchone()
-    stamps_str = ""
-    if user:
-        try:
-            stamps_str = user["stamps"] if user["stamps"] else ""
-        except (KeyError, IndexError):
-            stamps_str = ""
-    conn.close()
-    
-    # 解析stamps字符串为列表
-    collected_stamps = [int(s) for s in stamps_str.split(",") if s.strip()] if stamps_str else []
+    # 获取用户已收集的stamps（包括 session 里记着、还在某个 worker 队列中的）
+    user_id = current_user_id()
+    collected_stamps = []
+    if user_id is not None:
+        queued = session.get(QUEUED_STAMPS_KEY, [])
+        collected_stamps, stored = stamps.collected(user_id, queued)
+        if stored:
+            _forget_queued(stored)
     
-    return render_template("estamp.html", user_name=user_name, collected_stamps=collected_stamps)
+    return render_template(
+        "estamp.html",
+        user_name=user_name,
+        collected_stamps=collected_stamps,
+        stamp_labels=activities.get().stamp_labels,
+    )
+
+
+SAVE_FAILED_MESSAGE = "Could not save your stamp. Please try again."
+
+
+@app.route("/estamp/<int:idx>", methods=["POST"])
+def award_stamp(idx):
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"success": False, "error": "Not logged in"}), 401
+    if not stamps.is_valid(idx):
+        return jsonify({"success": False, "error": "Unknown stamp"}), 404
+
+    try:
+        # 幂等：重复提交同一个印章不会报错，也不会重复记录
+        awarded = _record_stamp(user_id, idx)
+        db.commit()
+        return jsonify({"success": True, "awarded": awarded, "queued": awarded is None})
+    except db.DatabaseError:
+        db.rollback()
+        app.logger.exception("saving stamps for user %s failed", user_id)
+        return jsonify({"success": False, "error": SAVE_FAILED_MESSAGE}), 500
 
 
 @app.route("/estamp/save", methods=["POST"])
 def save_stamps():
-    user_name = session.get("user_name")
-    if not user_name:
+    # 兼容还缓存着旧页面的客户端：只做并集写入，不会删除已有印章
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({"success": False, "error": "Not logged in"}), 401
     
+    data = request.get_json(silent=True)
+    raw = data.get("stamps", []) if isinstance(data, dict) else None
+    try:
+        if not isinstance(raw, list):
+            raise TypeError
+        indexes = {int(s) for s in raw}
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "stamps must be a list of stamp numbers"}), 400
+
     try:
-        data = request.get_json()
-        stamps = data.get("stamps", [])
-        stamps_str = ",".join(map(str, sorted(stamps)))  # 排序确保顺序一致
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("UPDATE users SET stamps = ? WHERE name = ?", (stamps_str, user_name))
-        conn.commit()
-        conn.close()
-        
+        for idx in sorted(indexes):
+            if stamps.is_valid(idx):
+                _record_stamp(user_id, idx)
+        db.commit()
         return jsonify({"success": True})
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    except db.DatabaseError:
+        db.rollback()
+        app.logger.exception("saving stamps for user %s failed", user_id)
+        return jsonify({"success": False, "error": SAVE_FAILED_MESSAGE}), 500
+
+
+@app.route("/estamp/pass.svg", methods=["GET"])
+def attendee_pass():
+    # 参会者的通行码，供现场工作人员用扫码枪扫描
+    user_id = current_user_id()
+    if user_id is None:
+        return redirect(url_for("index"))
+    svg = checkin.qr_svg(checkin.pass_token(user_id))
+    if svg is None:
+        return jsonify({"success": False, "error": "QR code support is not installed"}), 501
+    response = Response(svg, mimetype="image/svg+xml")
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+
+@app.route("/checkin/<token>", methods=["GET"])
+def checkin_stamp(token):
+    # 参会者用手机扫摊位二维码：令牌只做签名校验，不查数据库
+    user_id = current_user_id()
+    if user_id is None:
+        flash("Please sign in first, then scan the code again.", "danger")
+        return redirect(url_for("index") + "?no_splash=1")
+    try:
+        idx = checkin.verify_stamp(token)
+    except checkin.InvalidToken as e:
+        flash("This check-in code is %s. Please scan the latest code at the booth." % e, "danger")
+        return redirect(url_for("estamp"))
+    if not stamps.is_valid(idx):
+        flash("This check-in code is invalid.", "danger")
+        return redirect(url_for("estamp"))
+
+    _record_stamp(user_id, idx)
+    db.commit()
+    return redirect(url_for("estamp"))
+
+
+def _verify_scan(scan):
+    """校验一次扫码枪提交，返回 (user_id, stamp_idx)。"""
+    if not isinstance(scan, dict):
+        raise checkin.InvalidToken("invalid")
+    idx = checkin.verify_scanner(str(scan.get("scanner", "")))
+    user_id = checkin.verify_pass(str(scan.get("pass", "")))
+    if not stamps.is_valid(idx):
+        raise checkin.InvalidToken("invalid")
+    return user_id, idx
+
+
+@app.route("/checkin/scan", methods=["POST"])
+def checkin_scan():
+    # 工作人员扫码枪：{"scanner": 扫码枪密钥, "pass": 参会者通行码}
+    try:
+        user_id, idx = _verify_scan(request.get_json(silent=True))
+    except checkin.InvalidToken as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        awarded = stamps.record(user_id, idx)
+        db.commit()
+    except db.DatabaseError:
+        db.rollback()
+        app.logger.exception("scanner stamp for user %s failed", user_id)
+        return jsonify({"success": False, "error": SAVE_FAILED_MESSAGE}), 503
+    return jsonify({"success": True, "user_id": user_id, "stamp": idx, "awarded": awarded})
+
+
+@app.route("/checkin/batch", methods=["POST"])
+def checkin_batch():
+    # 离线扫码枪重新联网后一次上传：{"scans": [{"scanner": ..., "pass": ...}, ...]}
+    data = request.get_json(silent=True)
+    scans = data.get("scans") if isinstance(data, dict) else None
+    if not isinstance(scans, list) or len(scans) > checkin.BATCH_MAX:
+        return jsonify({"success": False, "error": "scans must be a list of at most %d items" % checkin.BATCH_MAX}), 400
+
+    results = []
+    pairs = set()
+    for scan in scans:
+        try:
+            pair = _verify_scan(scan)
+        except checkin.InvalidToken as e:
+            results.append({"ok": False, "error": str(e)})
+            continue
+        pairs.add(pair)
+        results.append({"ok": True, "user_id": pair[0], "stamp": pair[1]})
+
+    # 一批扫描只有一次写入、一次提交；失败时整批回滚，扫码枪保留数据稍后重传
+    try:
+        stamps.award_many(pairs)
+        db.commit()
+    except db.DatabaseError:
+        db.rollback()
+        app.logger.exception("scanner batch of %d stamps failed", len(pairs))
+        return jsonify({"success": False, "error": SAVE_FAILED_MESSAGE}), 503
+    return jsonify({"success": True, "accepted": len(pairs), "results": results})
 
 
 @app.route("/logout", methods=["GET"])
@@ -287,19 +371,14 @@ def reset_password():
         flash("Please enter account and new password.", "danger")
         return redirect(url_for("index"))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE users
-        SET password = ?
-        WHERE name = ? OR email = ?
-        """,
-        (new_password, account, account),
-    )
-    conn.commit()
-    updated = cur.rowcount
-    conn.close()
+    try:
+        password_hash = passwords.hash_password(new_password)
+    except passwords.Overloaded:
+        flash(BUSY_MESSAGE, "danger")
+        return redirect(url_for("index"))
+
+    updated = users.set_password(account, password_hash)
+    db.commit()
 
     if updated:
         flash("Password has been reset. Please sign in with your new password.", "success")
@@ -309,27 +388,172 @@ def reset_password():
     return redirect(url_for("index"))
 
 
-@app.route("/admin/users")
-def admin_users():
+ADMIN_USERS = ["admin", "cc"]  # 替换为你的管理员用户名
+
+
+def is_admin():
     # 检查是否为管理员（这里简单检查session中的用户名）
     # 你可以修改这个逻辑来实现更安全的管理员验证
-    if not session.get("user_name") or session.get("user_name") not in ["admin", "cc"]:  # 替换为你的管理员用户名
+    return session.get("user_name") in ADMIN_USERS
+
+
+@app.route("/admin/users")
+def admin_users():
+    if not is_admin():
         flash("Access denied. Admin privileges required.", "danger")
         return redirect(url_for("welcome"))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
+    query = request.args.get("q", "").strip()
+    after = request.args.get("after", 0, type=int)
+    limit = request.args.get("limit", users.PAGE_SIZE, type=int)
+
+    # 按 id 游标分页，只取一页数据；统计数字在 SQL 里聚合
+    page, next_after = users.search_page(query, after, limit)
+    stats = users.summary()
+
+    return render_template(
+        "admin_users.html",
+        users=page,
+        stats=stats,
+        query=query,
+        after=after,
+        limit=limit,
+        next_after=next_after,
+    )
+
+
+@app.route("/admin/checkin/<int:idx>")
+def admin_checkin(idx):
+    if not is_admin():
+        flash("Access denied. Admin privileges required.", "danger")
+        return redirect(url_for("welcome"))
+    if not stamps.is_valid(idx):
+        flash("Unknown stamp.", "danger")
+        return redirect(url_for("admin_users"))
+
+    # 摊位二维码定时刷新，旧码在 CHECKIN_STAMP_MAX_AGE 秒后失效
+    checkin_url = url_for("checkin_stamp", token=checkin.stamp_token(idx), _external=True)
+    return render_template(
+        "checkin.html",
+        idx=idx,
+        checkin_url=checkin_url,
+        qr_svg=checkin.qr_svg(checkin_url),
+        scanner_token=checkin.scanner_token(idx),
+        refresh_seconds=max(30, checkin.STAMP_MAX_AGE // 2),
+    )
+
 
-    # 获取所有用户数据
-    if hasattr(conn, 'get_dsn_parameters'):  # PostgreSQL
-        cur.execute("SELECT id, name, email, phone, stamps FROM users ORDER BY id")
-    else:  # SQLite
-        cur.execute("SELECT id, name, email, phone, stamps FROM users ORDER BY id")
+@app.route("/metrics")
+def metrics_endpoint():
+    # 管理员登录后可直接查看；Prometheus 抓取时用 Authorization: Bearer $METRICS_TOKEN
+    token = os.environ.get("METRICS_TOKEN")
+    auth = request.headers.get("Authorization", "")
+    if not is_admin() and not (token and hmac.compare_digest(auth.encode(), ("Bearer " + token).encode())):
+        return Response("Admin privileges required\n", status=403, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/users/export.<fmt>")
+def export_users(fmt):
+    if not is_admin():
+        return jsonify({"success": False, "error": "Admin privileges required"}), 403
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"success": False, "error": "Unsupported format"}), 404
+
+    def generate():
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(["id", "name", "email", "phone", "stamps"])
+            for row in users.export_rows():
+                writer.writerow([row["id"], row["name"], row["email"], row["phone"] or "", ",".join(map(str, row["stamps"]))])
+                # 攒到一定大小再吐出去，避免每行一个 chunk
+                if buf.tell() > 16384:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            yield buf.getvalue()
+        else:
+            chunk = []
+            for row in users.export_rows():
+                chunk.append(json.dumps(row, ensure_ascii=False))
+                if len(chunk) >= 500:
+                    yield "\n".join(chunk) + "\n"
+                    chunk = []
+            if chunk:
+                yield "\n".join(chunk) + "\n"
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(
+        generate(),
+        mimetype=mimetype,
+        headers={"Content-Disposition": "attachment; filename=users.%s" % fmt},
+    )
+
+
+@app.route("/admin/activities", methods=["GET", "POST"])
+def admin_activities():
+    if not is_admin():
+        return jsonify({"success": False, "error": "Admin privileges required"}), 403
+    if request.method == "GET":
+        return jsonify({"success": True, "activities": activities.list_all()})
+
+    try:
+        values = activities.validate(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    activity_id = activities.create(values)
+    # 版本号和修改同一个事务提交，其它 worker 轮询到新版本后重新加载
+    activities.bump_version()
+    db.commit()
+    activities.invalidate()
+    return jsonify({"success": True, "id": activity_id}), 201
+
+
+@app.route("/admin/activities/<int:activity_id>", methods=["PUT", "DELETE"])
+def admin_activity(activity_id):
+    if not is_admin():
+        return jsonify({"success": False, "error": "Admin privileges required"}), 403
+
+    if request.method == "DELETE":
+        found = activities.delete(activity_id)
+    else:
+        try:
+            values = activities.validate(request.get_json(silent=True) or {}, partial=True)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        found = activities.update(activity_id, values)
+    if not found:
+        db.rollback()
+        return jsonify({"success": False, "error": "Activity not found"}), 404
+    activities.bump_version()
+    db.commit()
+    activities.invalidate()
+    return jsonify({"success": True})
+
+
+@app.route("/admin/live")
+def admin_live():
+    if not is_admin():
+        flash("Access denied. Admin privileges required.", "danger")
+        return redirect(url_for("welcome"))
+    return render_template(
+        "admin_live.html", stamp_labels=activities.get().stamp_labels, signup_minutes=live.SIGNUP_MINUTES
+    )
 
-    users = cur.fetchall()
-    conn.close()
 
-    return render_template("admin_users.html", users=users)
+@app.route("/admin/live/stream")
+def admin_live_stream():
+    if not is_admin():
+        return jsonify({"success": False, "error": "Admin privileges required"}), 403
+    # 每个进程的长连接数有上限，避免面板占满 worker 线程；浏览器按 retry 间隔自动重连
+    if not live.broadcaster.try_subscribe():
+        return Response("Too many dashboards open\n", status=503, mimetype="text/plain", headers={"Retry-After": "5"})
+    response = Response(live.stream(), mimetype="text/event-stream")
+    response.call_on_close(live.broadcaster.unsubscribe)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 # Railway会自动调用这个应用实例
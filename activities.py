@@ -0,0 +1,234 @@
+"""活动目录：``activities`` 表里的工作坊、海报和各印章对应的活动。
+
+``/activity`` 和 E-Stamp 页面每次请求都要用到，但内容只在管理员修改时才变。
+这里在进程内缓存一份已经渲染好的卡片片段和印章标签：
+
+- 命中缓存时请求不查数据库，也不在模板里循环；
+- 每隔 ``ACTIVITY_VERSION_POLL`` 秒最多查一次 ``cache_versions`` 里的版本号，
+  管理员修改后 ``bump_version()`` 让版本号加一，所有 gunicorn worker 在一个
+  轮询周期内重新加载，不需要重启；
+- ``ACTIVITY_CACHE_TTL`` 秒后无论版本号是否变化都重新加载一次，兜底。
+"""
+import os
+import threading
+import time
+
+from flask import get_template_attribute, url_for
+from markupsafe import Markup
+from werkzeug.routing import BuildError
+
+import db
+import stamps
+
+CACHE_TTL = float(os.environ.get("ACTIVITY_CACHE_TTL", 300))
+VERSION_POLL = float(os.environ.get("ACTIVITY_VERSION_POLL", 5))
+VERSION_KEY = "activities"
+
+COLUMNS = ["id", "title", "time", "description", "position", "icon", "link", "poster", "stamp_idx", "stamp_label"]
+EDITABLE = COLUMNS[1:]
+
+# 原来写死在 activity.html / estamp.html 里的内容，迁移时写入空表。
+# link 可以是站内路径、#弹窗 id、http(s) 链接，或者本站的 endpoint 名（渲染时 url_for）
+SEED = [
+    {"title": "Application Process", "icon": "✍️", "link": "apply", "stamp_idx": 0,
+     "stamp_label": "Apply 2026 MA Program"},
+    {"title": "Workshop 1 Site Visit", "icon": "🏭", "poster": "海報2.png", "stamp_idx": 2,
+     "stamp_label": "Workshop 1 Site Visit"},
+    {"title": "Workshop 2 Game Day", "icon": "👥", "poster": "海報3.png", "stamp_idx": 3,
+     "stamp_label": "Workshop 2 Game day"},
+    {"title": "Instagram & LinkedIn", "icon": "❤️", "link": "#igModal", "stamp_idx": 1,
+     "stamp_label": "Like & Follow DKSH's IG and Linkedln"},
+]
+
+# 旧库里已有只含前五列的 activities 表，缺的列逐个补上
+_EXTRA_COLUMNS = [
+    ("icon", "TEXT DEFAULT ''"),
+    ("link", "TEXT DEFAULT ''"),
+    ("poster", "TEXT DEFAULT ''"),
+    ("stamp_idx", "INTEGER"),
+    ("stamp_label", "TEXT DEFAULT ''"),
+]
+
+
+def create_table(conn):
+    if db.is_postgres():
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS activities (
+                id SERIAL PRIMARY KEY,
+                title TEXT NOT NULL,
+                time TEXT,
+                description TEXT,
+                position INTEGER DEFAULT 0
+            )
+            """,
+            conn=conn,
+        )
+        for name, kind in _EXTRA_COLUMNS:
+            db.execute("ALTER TABLE activities ADD COLUMN IF NOT EXISTS %s %s" % (name, kind), conn=conn)
+    else:
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS activities (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                time TEXT,
+                description TEXT,
+                position INTEGER DEFAULT 0
+            )
+            """,
+            conn=conn,
+        )
+        existing = {row["name"] for row in db.query_all("PRAGMA table_info(activities)", conn=conn)}
+        for name, kind in _EXTRA_COLUMNS:
+            if name not in existing:
+                db.execute("ALTER TABLE activities ADD COLUMN %s %s" % (name, kind), conn=conn)
+
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS cache_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)",
+        conn=conn,
+    )
+    db.execute(
+        "INSERT INTO cache_versions (name, version) VALUES (?, 0) ON CONFLICT (name) DO NOTHING",
+        (VERSION_KEY,),
+        conn=conn,
+    )
+
+
+def seed(conn):
+    """表为空时写入原来页面上的四项活动。"""
+    if db.query_one("SELECT COUNT(*) AS n FROM activities", conn=conn)["n"]:
+        return 0
+    for position, item in enumerate(SEED):
+        create(dict(item, position=position), conn=conn)
+    return len(SEED)
+
+
+def validate(data, partial=False):
+    """把管理接口提交的 JSON 整理成列值，不合法时抛 ValueError。"""
+    values = {}
+    for column in EDITABLE:
+        if column not in data:
+            continue
+        value = data[column]
+        if column in ("position", "stamp_idx"):
+            if value in (None, "") and column == "stamp_idx":
+                value = None
+            else:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise ValueError("%s must be an integer" % column)
+                if column == "stamp_idx" and not stamps.is_valid(value):
+                    raise ValueError("stamp_idx must be between 0 and %d" % (stamps.STAMP_COUNT - 1))
+        else:
+            value = "" if value is None else str(value).strip()
+        values[column] = value
+    if "link" in values and values["link"] and not values["link"].startswith(("/", "#", "https://", "http://")):
+        if not _is_endpoint(values["link"]):
+            raise ValueError("link must be a path, a #modal id, an http(s) URL or a page endpoint name")
+    if not partial and not values.get("title"):
+        raise ValueError("title is required")
+    if "title" in values and not values["title"]:
+        raise ValueError("title must not be empty")
+    return values
+
+
+def _is_endpoint(name):
+    # 需要在请求上下文里调用；带参数的 endpoint 生成不了 URL，也不接受
+    try:
+        url_for(name)
+    except BuildError:
+        return False
+    return True
+
+
+def list_all(conn=None):
+    rows = db.query_all("SELECT %s FROM activities ORDER BY position, id" % ", ".join(COLUMNS), conn=conn)
+    return [dict(row) for row in rows]
+
+
+def create(values, conn=None):
+    """新增一项活动，返回新 id。调用方负责 bump_version() 和 commit。"""
+    columns = list(values)
+    row = db.query_one(
+        "INSERT INTO activities (%s) VALUES (%s) RETURNING id" % (", ".join(columns), ", ".join("?" * len(columns))),
+        tuple(values[c] for c in columns),
+        conn=conn,
+    )
+    return row["id"]
+
+
+def update(activity_id, values, conn=None):
+    """修改一项活动，返回是否存在。调用方负责 bump_version() 和 commit。"""
+    if not values:
+        return db.query_one("SELECT id FROM activities WHERE id = ?", (activity_id,), conn=conn) is not None
+    assignments = ", ".join("%s = ?" % c for c in values)
+    cur = db.execute(
+        "UPDATE activities SET %s WHERE id = ?" % assignments,
+        tuple(values.values()) + (activity_id,),
+        conn=conn,
+    )
+    return cur.rowcount == 1
+
+
+def delete(activity_id, conn=None):
+    cur = db.execute("DELETE FROM activities WHERE id = ?", (activity_id,), conn=conn)
+    return cur.rowcount == 1
+
+
+def bump_version(conn=None):
+    """让所有 worker 在下一次轮询时重新加载。和修改在同一个事务里提交，提交后再 invalidate()。"""
+    db.execute("UPDATE cache_versions SET version = version + 1 WHERE name = ?", (VERSION_KEY,), conn=conn)
+
+
+def _read_version():
+    row = db.query_one("SELECT version FROM cache_versions WHERE name = ?", (VERSION_KEY,))
+    return row["version"] if row else 0
+
+
+class Catalog:
+    """一次加载的结果；替换整个对象，读请求不需要加锁。"""
+
+    def __init__(self, items, version):
+        self.items = items
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.checked_at = self.loaded_at
+        self.cards_html = Markup(get_template_attribute("activity_cards.html", "cards")(items))
+        self.modals_html = Markup(get_template_attribute("activity_cards.html", "modals")(items))
+        labels = ["Stamp %d" % (i + 1) for i in range(stamps.STAMP_COUNT)]
+        for item in items:
+            if item["stamp_idx"] is not None and stamps.is_valid(item["stamp_idx"]):
+                labels[item["stamp_idx"]] = item["stamp_label"] or item["title"]
+        self.stamp_labels = labels
+
+
+_catalog = None
+_load_lock = threading.Lock()
+
+
+def invalidate():
+    """丢弃本进程的缓存（其它进程靠版本号轮询）。"""
+    global _catalog
+    _catalog = None
+
+
+def get():
+    """返回当前的 Catalog；需要在请求上下文里调用（渲染片段要用 url_for）。"""
+    global _catalog
+    catalog = _catalog
+    now = time.monotonic()
+    if catalog is not None and now - catalog.checked_at < VERSION_POLL and now - catalog.loaded_at < CACHE_TTL:
+        return catalog
+    with _load_lock:
+        catalog = _catalog
+        now = time.monotonic()
+        if catalog is not None and now - catalog.checked_at < VERSION_POLL and now - catalog.loaded_at < CACHE_TTL:
+            return catalog
+        version = _read_version()
+        if catalog is not None and catalog.version == version and now - catalog.loaded_at < CACHE_TTL:
+            catalog.checked_at = now
+            return catalog
+        _catalog = Catalog(list_all(), version)
+        return _catalog
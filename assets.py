@@ -0,0 +1,124 @@
+"""静态资源指纹与压缩。
+
+启动时对 static/ 下的文件计算一次内容哈希，``url_for('static', ...)`` 会自动带上
+``?v=<hash>``；带正确版本号的请求返回一年的 ``immutable`` 缓存。文本类资源在
+启动时预先压缩成 gzip / brotli 放在内存里，按 ``Accept-Encoding`` 直接返回。
+HTML 页面在 after_request 里加 ETag（命中时返回 304）并做 gzip。
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，没有时只提供 gzip
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+COMPRESSIBLE = (".js", ".css", ".svg", ".json", ".txt", ".html")
+SKIP = (".lock", ".tmp")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MIN_COMPRESS_BYTES = 512
+
+_versions = {}
+_compressed = {}
+
+
+def _walk():
+    for root, _dirs, files in os.walk(STATIC_DIR):
+        for name in files:
+            if name.endswith(SKIP) or name == "manifest.json":
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, STATIC_DIR).replace(os.sep, "/"), path
+
+
+def build():
+    """计算所有静态文件的指纹，并预压缩文本资源。"""
+    versions = {}
+    compressed = {}
+    for rel, path in _walk():
+        with open(path, "rb") as f:
+            data = f.read()
+        versions[rel] = hashlib.sha256(data).hexdigest()[:12]
+        if rel.lower().endswith(COMPRESSIBLE) and len(data) >= MIN_COMPRESS_BYTES:
+            compressed[(rel, "gzip")] = gzip.compress(data, 9)
+            if brotli is not None:
+                compressed[(rel, "br")] = brotli.compress(data, quality=11)
+    return versions, compressed
+
+
+def _negotiate(filename):
+    """按客户端 Accept-Encoding 选择预压缩版本，优先 br。"""
+    for encoding in ("br", "gzip"):
+        if (filename, encoding) in _compressed and request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def serve_static(filename):
+    version = _versions.get(filename)
+    encoding = _negotiate(filename)
+    if encoding:
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        response = Response(_compressed[(filename, encoding)], mimetype=mimetype)
+        response.headers["Content-Encoding"] = encoding
+        response.set_etag("%s-%s" % (version, encoding))
+        response.make_conditional(request)
+    else:
+        response = current_app.send_static_file(filename)
+    if filename.lower().endswith(COMPRESSIBLE):
+        response.vary.add("Accept-Encoding")
+
+    if version and request.args.get("v") == version:
+        # 内容变了 URL 就变，所以可以放心让浏览器永久缓存
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def add_static_version(endpoint, values):
+    if endpoint == "static" and "filename" in values:
+        version = _versions.get(values["filename"])
+        if version:
+            values.setdefault("v", version)
+
+
+def compress_html(response):
+    """HTML 页面：先做 ETag / 304，再按需 gzip。"""
+    if (
+        response.mimetype != "text/html"
+        or response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    # 页面内容依赖登录状态，只允许浏览器私有缓存，每次回来校验
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag(weak=True)
+    response.make_conditional(request)
+    if response.status_code != 200:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) >= MIN_COMPRESS_BYTES and request.accept_encodings["gzip"]:
+        response.set_data(gzip.compress(data, 6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def init_app(app):
+    global _versions, _compressed
+    _versions, _compressed = build()
+    app.url_defaults(add_static_version)
+    app.view_functions["static"] = serve_static
+    app.after_request(compress_html)
@@ -0,0 +1,104 @@
+"""登录吞吐与密码哈希成本：每种 PASSWORD_HASH_METHOD 各启动一次真实的 gunicorn。
+
+先在本进程里测单次哈希耗时，再用 loadgen 的 login_storm 场景集中登录，
+记录吞吐、延迟分位数和被哈希线程池拒绝（"server is busy"）的次数：
+
+    python benchmarks/bench_login.py
+    python benchmarks/bench_login.py --methods scrypt:16384:8:1,scrypt:32768:8:1 --clients 16 --hash-queue 4
+"""
+import argparse
+import http.client
+import multiprocessing
+import re
+import shutil
+import time
+
+import common
+import loadgen
+
+METHODS = ("pbkdf2:sha256:100000", "pbkdf2:sha256:600000", "scrypt:16384:8:1", "scrypt:32768:8:1")
+METRICS_TOKEN = "bench-login"
+
+
+def hash_seconds(method, rounds=5):
+    from werkzeug.security import generate_password_hash
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        generate_password_hash(loadgen.PASSWORD, method=method)
+    return (time.perf_counter() - start) / rounds
+
+
+def _rejected(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("GET", "/metrics", headers={"Authorization": "Bearer " + METRICS_TOKEN})
+    body = conn.getresponse().read().decode()
+    return sum(int(float(n)) for n in re.findall(r"^password_hash_rejected_total\{[^}]*\} (\S+)$", body, re.M))
+
+
+def run_method(method, args):
+    tmp, url = common.temp_database("login")
+    common.prepare_database(url, seed_users=args.seed_users, password=loadgen.PASSWORD, method=method)
+    extra_env = {
+        "PASSWORD_HASH_METHOD": method,
+        "PASSWORD_HASH_WORKERS": str(args.hash_workers),
+        "METRICS_TOKEN": METRICS_TOKEN,
+    }
+    if args.hash_queue is not None:
+        extra_env["PASSWORD_HASH_QUEUE"] = str(args.hash_queue)
+    port = loadgen._free_port()
+    proc = loadgen.start_gunicorn(url, port, args.workers, "gthread", args.threads, extra_env, tmp)
+    try:
+        jobs = [("login_storm", port, c, args.ops, "login", args.seed_users) for c in range(args.clients)]
+        with multiprocessing.Pool(args.clients) as pool:
+            start = time.perf_counter()
+            batches = pool.map(loadgen._client_worker, jobs)
+            elapsed = time.perf_counter() - start
+        samples = [s for batch in batches for s in batch]
+        result = common.summarize([t for t, ok in samples if ok], sum(1 for _t, ok in samples if not ok), elapsed)
+        result["rejected"] = _rejected(port)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--methods", default=",".join(METHODS))
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--hash-workers", type=int, default=2, help="PASSWORD_HASH_WORKERS")
+    parser.add_argument("--hash-queue", type=int, help="PASSWORD_HASH_QUEUE (default: derived from --threads)")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client processes")
+    parser.add_argument("--ops", type=int, default=20, help="logins per client")
+    parser.add_argument("--seed-users", type=int, default=1000)
+    parser.add_argument("--output", help="result JSON path (default: benchmarks/results/login-<commit>.json)")
+    args = parser.parse_args()
+
+    results = {}
+    for method in [m for m in args.methods.split(",") if m]:
+        single = hash_seconds(method)
+        result = run_method(method, args)
+        result["hash_ms"] = round(single * 1000, 1)
+        results[method] = result
+
+    common.print_table(results)
+    print("%-28s %9s %9s" % ("method", "hash ms", "rejected"))
+    for method, r in results.items():
+        print("%-28s %9.1f %9d" % (method, r["hash_ms"], r["rejected"]))
+    config = {
+        "workers": args.workers,
+        "threads": args.threads,
+        "hash_workers": args.hash_workers,
+        "hash_queue": args.hash_queue if args.hash_queue is not None else max(0, args.threads // 2 - args.hash_workers),
+        "clients": args.clients,
+        "ops": args.ops,
+        "seed_users": args.seed_users,
+    }
+    print("results written to %s" % common.write_results("login", config, results, args.output))
+
+
+if __name__ == "__main__":
+    main()
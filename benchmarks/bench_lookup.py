@@ -0,0 +1,79 @@
+"""登录查找基准：旧的 ``name = ? OR email = ?`` 全表扫描 vs 新的索引点查。
+
+在临时 SQLite 库里分别灌入 1 万 / 10 万 / 100 万用户，测量每种查找的平均延迟：
+
+    python benchmarks/bench_lookup.py
+    python benchmarks/bench_lookup.py --sizes 10000,100000 --lookups 2000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AUTO_MIGRATE", "0")  # 只迁移临时库，不碰仓库里的 users.db
+
+import db  # noqa: E402
+import users  # noqa: E402
+from App import app, init_db  # noqa: E402
+
+OLD_LOOKUP = "SELECT * FROM users WHERE name = ? OR email = ?"
+
+
+def populate(path, size):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+        "email TEXT UNIQUE, phone TEXT, password TEXT NOT NULL, stamps TEXT DEFAULT '')"
+    )
+    conn.executemany(
+        "INSERT INTO users (name, email, phone, password) VALUES (?, ?, ?, ?)",
+        (("user%07d" % i, "user%07d@example.com" % i, "", "secret%d" % i) for i in range(size)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(fn, accounts):
+    start = time.perf_counter()
+    for account in accounts:
+        fn(account)
+    return (time.perf_counter() - start) / len(accounts) * 1e6
+
+
+def run(size, lookups, old_lookups):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        populate(path, size)
+        db.configure("sqlite:///" + path)
+        rng = random.Random(size)
+        names = ["user%07d" % rng.randrange(size) for _ in range(lookups)]
+        emails = [name.upper() + "@EXAMPLE.COM" for name in names]
+        with app.app_context():
+            # 旧查询在建索引之前测，和线上现状一致；它是全表扫描，所以少测几次
+            old = measure(lambda a: db.query_one(OLD_LOOKUP, (a, a)), names[:old_lookups])
+            init_db()
+            by_name = measure(users.find_by_account, names)
+            by_email = measure(users.find_by_account, emails)
+        db.configure()
+    return {"users": size, "old_or_us": old, "name_us": by_name, "email_us": by_email}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--old-lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    print("%10s %16s %16s %16s" % ("users", "old OR (us)", "name (us)", "email (us)"))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        r = run(size, args.lookups, args.old_lookups)
+        print("%10d %16.1f %16.1f %16.1f" % (r["users"], r["old_or_us"], r["name_us"], r["email_us"]))
+
+
+if __name__ == "__main__":
+    main()
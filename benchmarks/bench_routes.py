@@ -0,0 +1,114 @@
+"""路由微基准：用 Flask test client 在进程内逐个压测各路由。
+
+不经过网络和 gunicorn，只衡量应用本身（模板、查询、会话）的开销：
+
+    python benchmarks/bench_routes.py
+    python benchmarks/bench_routes.py --iterations 500 --seed-users 10000 --output results.json
+"""
+import argparse
+import os
+import shutil
+import time
+
+import common
+
+import db  # noqa: E402  (common 已把仓库根目录加入 sys.path)
+from App import app  # noqa: E402
+
+
+def _time(fn, iterations):
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        ok = fn(i)
+        latencies.append(time.perf_counter() - t0)
+        errors += 0 if ok else 1
+    return common.summarize(latencies, errors, time.perf_counter() - start)
+
+
+def _login(client, name, password="secret123"):
+    client.post("/login", data={"account": name, "password": password})
+
+
+def _switch_user(client, name):
+    # 计时循环里换用户：直接写 session，不把一次密码校验算进发章的耗时
+    with client.session_transaction() as session:
+        session.clear()
+        session["user_name"] = name
+
+
+def run(iterations, seed_users):
+    tmp, url = common.temp_database("bench-routes")
+    try:
+        common.prepare_database(url, seed_users=max(seed_users, iterations))
+        db.configure(url)
+        results = {}
+        client = app.test_client()
+
+        results["GET /"] = _time(lambda i: client.get("/").status_code == 200, iterations)
+        results["POST /register"] = _time(
+            lambda i: client.post(
+                "/register",
+                data={"name": "new%07d" % i, "email": "new%07d@example.com" % i, "phone": "", "password": "secret123"},
+            ).headers.get("Location", "").endswith("#login"),
+            iterations,
+        )
+        results["POST /login"] = _time(
+            lambda i: client.post("/login", data={"account": "user%07d" % i, "password": "secret123"}).headers.get(
+                "Location", ""
+            ).endswith("/welcome"),
+            iterations,
+        )
+
+        _login(client, "user0000000")
+        results["GET /estamp"] = _time(lambda i: client.get("/estamp").status_code == 200, iterations)
+        results["GET /activity"] = _time(lambda i: client.get("/activity").status_code == 200, iterations)
+
+        def award(i):
+            # 每个用户发满 4 个印章后换下一个用户
+            if i % 4 == 0:
+                _switch_user(client, "user%07d" % (i // 4))
+            return client.post("/estamp/%d" % (i % 4)).status_code == 200
+
+        results["POST /estamp/<idx>"] = _time(award, iterations)
+        results["POST /estamp/save"] = _time(
+            lambda i: client.post("/estamp/save", json={"stamps": [0, 1, 2, 3]}).status_code == 200, iterations
+        )
+
+        client.post("/register", data={"name": "admin", "email": "admin@example.com", "password": "secret123"})
+        _login(client, "admin")
+        results["GET /admin/users"] = _time(lambda i: client.get("/admin/users").status_code == 200, iterations)
+        results["GET /admin/users?q="] = _time(
+            lambda i: client.get("/admin/users?q=user%03d" % (i % 1000)).status_code == 200, iterations
+        )
+        export_iterations = max(1, iterations // 50)
+        results["GET /admin/users/export.csv"] = _time(
+            lambda i: len(client.get("/admin/users/export.csv").data) > 0, export_iterations
+        )
+        return results
+    finally:
+        db.configure()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed-users", type=int, default=1000)
+    parser.add_argument("--output", help="result JSON path (default: benchmarks/results/routes-<commit>.json)")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.seed_users)
+    common.print_table(results)
+    config = {
+        "iterations": args.iterations,
+        "seed_users": args.seed_users,
+        "write_behind": os.environ.get("STAMP_WRITE_BEHIND") == "1",
+    }
+    print("results written to %s" % common.write_results("routes", config, results, args.output))
+
+
+if __name__ == "__main__":
+    main()
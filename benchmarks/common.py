@@ -0,0 +1,105 @@
+"""基准脚本共用的工具：临时数据库、分位数统计、结果文件读写。"""
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 导入 App 时不要迁移仓库里的 users.db；基准只在临时库上显式调用 init_db()
+os.environ.setdefault("AUTO_MIGRATE", "0")
+
+
+def temp_database(prefix="bench"):
+    """返回 (临时目录, DATABASE_URL)，库文件在临时目录里，用完由调用方删除。"""
+    tmp = tempfile.mkdtemp(prefix=prefix + "-")
+    return tmp, "sqlite:///" + os.path.join(tmp, "bench.db")
+
+
+def prepare_database(url, seed_users=0, password="secret123", method=None):
+    """建表并预先插入 ``user%07d`` 用户（登录压测用），不经过 HTTP。
+
+    所有用户共用一个按 ``method``（默认 ``PASSWORD_HASH_METHOD``）预先算好的哈希，
+    登录测的是稳态的校验，而不是明文旧数据第一次登录时的重算。
+    """
+    import db
+    import passwords
+    from App import app, init_db
+
+    db.configure(url)
+    with app.app_context():
+        init_db()
+        if seed_users:
+            stored = passwords.hash_sync(password, method)
+            db.executemany(
+                "INSERT INTO users (name, email, phone, password) VALUES (?, ?, ?, ?)",
+                [("user%07d" % i, "user%07d@example.com" % i, "", stored) for i in range(seed_users)],
+            )
+            db.commit()
+    db.configure()
+
+
+def percentile(sorted_values, pct):
+    """最近秩法分位数，输入必须已排序。"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    """latencies 单位为秒，返回吞吐和 p50/p95/p99（毫秒）。"""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(suite, config, results, path=None):
+    """把结果写成 JSON，默认 ``benchmarks/results/<suite>-<commit>.json``，返回路径。"""
+    commit = git_commit()
+    payload = {
+        "suite": suite,
+        "commit": commit,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, "%s-%s.json" % (suite, commit))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return path
+
+
+def print_table(results):
+    print("%-28s %9s %7s %11s %9s %9s %9s" % ("name", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+    for name, r in results.items():
+        print(
+            "%-28s %9d %7d %11.1f %9.2f %9.2f %9.2f"
+            % (name, r["requests"], r["errors"], r["throughput_rps"], r["p50_ms"], r["p95_ms"], r["p99_ms"])
+        )
@@ -0,0 +1,55 @@
+"""比较两次基准结果，p95 变慢或吞吐下降超过阈值时以非零状态退出：
+
+    python benchmarks/compare.py benchmarks/results/load-abc1234.json benchmarks/results/load-def5678.json
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(base, head, threshold):
+    regressions = []
+    print("%-28s %10s %10s %8s %11s %11s %8s" % ("name", "base p95", "head p95", "delta", "base req/s", "head req/s", "delta"))
+    for name, new in head["results"].items():
+        old = base["results"].get(name)
+        if old is None:
+            print("%-28s %10s %10.2f" % (name, "-", new["p95_ms"]))
+            continue
+        p95_delta = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        rps_delta = (new["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] * 100 if old["throughput_rps"] else 0.0
+        flag = ""
+        if p95_delta > threshold or rps_delta < -threshold or new["errors"] > old["errors"]:
+            regressions.append(name)
+            flag = "  <-- regression"
+        print(
+            "%-28s %10.2f %10.2f %+7.1f%% %11.1f %11.1f %+7.1f%%%s"
+            % (name, old["p95_ms"], new["p95_ms"], p95_delta, old["throughput_rps"], new["throughput_rps"], rps_delta, flag)
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent (default 10)")
+    args = parser.parse_args()
+
+    base, head = load(args.base), load(args.head)
+    if base["suite"] != head["suite"]:
+        sys.exit("cannot compare suite %r with %r" % (base["suite"], head["suite"]))
+    if base["config"] != head["config"]:
+        print("warning: configs differ: %s vs %s" % (base["config"], head["config"]))
+    print("base %s (%s) vs head %s (%s)" % (base["commit"], base["timestamp"], head["commit"], head["timestamp"]))
+    regressions = compare(base, head, args.threshold)
+    if regressions:
+        sys.exit("regressions: %s" % ", ".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""活动当天的负载测试：在本地启动真实的 gunicorn，用多进程客户端回放典型场景。
+
+场景：
+- signup_burst      扫码后集中注册
+- login_storm       集中登录
+- stamp_collection  登录后依次领取 4 个印章并刷新 E-Stamp 页面
+- admin_export      管理员翻页查看用户列表并导出 CSV
+
+数据库是临时 SQLite 文件，不会动到仓库里的 users.db：
+
+    python benchmarks/loadgen.py
+    python benchmarks/loadgen.py --workers 4 --clients 16 --ops 50 --scenarios login_storm,stamp_collection
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+
+import common
+
+SCENARIOS = ("signup_burst", "login_storm", "stamp_collection", "admin_export")
+PASSWORD = "secret123"
+
+
+class Client:
+    """最小的 HTTP 客户端：不跟随重定向，只保存 Flask 的 session cookie。"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.cookie = None
+
+    def request(self, method, path, form=None):
+        body = urllib.parse.urlencode(form) if form is not None else None
+        headers = {"Accept-Encoding": "gzip"}
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        # 每次新建连接，和扫码后各自打开页面的手机一样
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+        finally:
+            conn.close()
+        elapsed = time.perf_counter() - start
+        cookie = resp.getheader("Set-Cookie")
+        if cookie and cookie.startswith("session="):
+            self.cookie = cookie.split(";", 1)[0]
+        return resp, elapsed
+
+
+def _redirects_to(resp, suffix):
+    return resp.status == 302 and resp.getheader("Location", "").endswith(suffix)
+
+
+def _scenario(name, client, client_id, op, run_id, seed_users):
+    """执行一次操作，返回 [(耗时秒, 是否成功), ...]。"""
+    samples = []
+    if name == "signup_burst":
+        user = "load%s_%d_%d" % (run_id, client_id, op)
+        resp, t = client.request(
+            "POST", "/register", {"name": user, "email": user + "@example.com", "phone": "", "password": PASSWORD}
+        )
+        samples.append((t, _redirects_to(resp, "#login")))
+    elif name == "login_storm":
+        user = "user%07d" % ((client_id * 7919 + op) % seed_users)
+        resp, t = client.request("POST", "/login", {"account": user, "password": PASSWORD})
+        samples.append((t, _redirects_to(resp, "/welcome")))
+    elif name == "stamp_collection":
+        user = "user%07d" % ((client_id * 7919 + op) % seed_users)
+        resp, t = client.request("POST", "/login", {"account": user, "password": PASSWORD})
+        samples.append((t, _redirects_to(resp, "/welcome")))
+        for idx in range(4):
+            resp, t = client.request("POST", "/estamp/%d" % idx)
+            samples.append((t, resp.status == 200))
+        resp, t = client.request("GET", "/estamp")
+        samples.append((t, resp.status == 200))
+    elif name == "admin_export":
+        if op == 0:
+            client.request("POST", "/login", {"account": "admin", "password": PASSWORD})
+        resp, t = client.request("GET", "/admin/users?after=%d" % (op * 50))
+        samples.append((t, resp.status == 200))
+        if op % 10 == 0:
+            resp, t = client.request("GET", "/admin/users/export.csv")
+            samples.append((t, resp.status == 200))
+    return samples
+
+
+def _client_worker(args):
+    name, port, client_id, ops, run_id, seed_users = args
+    client = Client("127.0.0.1", port)
+    samples = []
+    for op in range(ops):
+        try:
+            samples.extend(_scenario(name, client, client_id, op, run_id, seed_users))
+        except (OSError, http.client.HTTPException):
+            samples.append((0.0, False))
+    return samples
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn exited with code %s" % proc.returncode)
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not become ready within %ss" % timeout)
+
+
+def start_gunicorn(url, port, workers, worker_class, threads, extra_env, tmp):
+    # 应用按 GUNICORN_THREADS 推算默认值（如密码哈希排队数），和命令行参数保持一致
+    env = dict(os.environ, DATABASE_URL=url, METRICS_DIR=os.path.join(tmp, "metrics"), GUNICORN_THREADS=str(threads), **extra_env)
+    cmd = [
+        sys.executable, "-m", "gunicorn", "App:app",
+        "--bind", "127.0.0.1:%d" % port,
+        "--workers", str(workers),
+        "--worker-class", worker_class,
+        "--threads", str(threads),
+        "--log-level", "warning",
+    ]
+    proc = subprocess.Popen(cmd, cwd=common.ROOT, env=env)
+    try:
+        _wait_ready(port, proc)
+    except Exception:
+        proc.terminate()
+        raise
+    return proc
+
+
+def run(scenarios, workers, worker_class, threads, clients, ops, seed_users, extra_env):
+    tmp, url = common.temp_database("loadgen")
+    common.prepare_database(
+        url, seed_users=seed_users, password=PASSWORD, method=extra_env.get("PASSWORD_HASH_METHOD")
+    )
+    port = _free_port()
+    proc = start_gunicorn(url, port, workers, worker_class, threads, extra_env, tmp)
+    results = {}
+    run_id = "%x" % int(time.time())
+    try:
+        # 管理员账号供 admin_export 场景使用
+        Client("127.0.0.1", port).request(
+            "POST", "/register", {"name": "admin", "email": "admin@example.com", "phone": "", "password": PASSWORD}
+        )
+        with multiprocessing.Pool(clients) as pool:
+            for name in scenarios:
+                jobs = [(name, port, c, ops, run_id, seed_users) for c in range(clients)]
+                start = time.perf_counter()
+                batches = pool.map(_client_worker, jobs)
+                elapsed = time.perf_counter() - start
+                samples = [s for batch in batches for s in batch]
+                latencies = [t for t, ok in samples if ok]
+                errors = sum(1 for _t, ok in samples if not ok)
+                results[name] = common.summarize(latencies, errors, elapsed)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--worker-class", default="gthread")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client processes")
+    parser.add_argument("--ops", type=int, default=25, help="operations per client per scenario")
+    parser.add_argument("--seed-users", type=int, default=5000)
+    parser.add_argument("--write-behind", action="store_true", help="run the server with STAMP_WRITE_BEHIND=1")
+    parser.add_argument("--output", help="result JSON path (default: benchmarks/results/load-<commit>.json)")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error("unknown scenarios: %s" % ", ".join(sorted(unknown)))
+    extra_env = {"STAMP_WRITE_BEHIND": "1"} if args.write_behind else {}
+
+    results = run(
+        scenarios, args.workers, args.worker_class, args.threads, args.clients, args.ops, args.seed_users, extra_env
+    )
+    common.print_table(results)
+    config = {
+        "workers": args.workers,
+        "worker_class": args.worker_class,
+        "threads": args.threads,
+        "clients": args.clients,
+        "ops": args.ops,
+        "seed_users": args.seed_users,
+        "write_behind": args.write_behind,
+    }
+    print("results written to %s" % common.write_results("load", config, results, args.output))
+
+
+if __name__ == "__main__":
+    main()
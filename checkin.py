@@ -0,0 +1,77 @@
+"""现场扫码发章用的签名令牌。
+
+令牌用 itsdangerous 签名并带时间戳，校验只需要 secret_key，不查数据库：
+
+- 摊位码 ``stamp_token(idx)``：印在摊位二维码上，参会者用手机扫码后给自己发章；
+- 扫码枪密钥 ``scanner_token(idx)``：只发给工作人员的设备，证明这台设备可以发某个印章；
+- 参会者通行码 ``pass_token(user_id)``：显示在参会者的 E-Stamp 页面，由扫码枪扫描。
+
+三种令牌用不同的 salt，互相不能冒用。
+"""
+import io
+import os
+
+from flask import current_app
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+try:
+    import qrcode
+    import qrcode.image.svg
+except ImportError:  # 没装 qrcode 时后台页面只显示链接
+    qrcode = None
+
+STAMP_MAX_AGE = int(os.environ.get("CHECKIN_STAMP_MAX_AGE", 15 * 60))
+SCANNER_MAX_AGE = int(os.environ.get("CHECKIN_SCANNER_MAX_AGE", 24 * 3600))
+PASS_MAX_AGE = int(os.environ.get("CHECKIN_PASS_MAX_AGE", 7 * 24 * 3600))
+BATCH_MAX = 1000  # 离线扫码枪一次最多上传的扫描条数
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _serializer(salt):
+    return URLSafeTimedSerializer(current_app.secret_key, salt=salt)
+
+
+def _load(salt, token, max_age):
+    try:
+        return _serializer(salt).loads(token, max_age=max_age)
+    except SignatureExpired:
+        raise InvalidToken("expired")
+    except BadSignature:
+        raise InvalidToken("invalid")
+
+
+def stamp_token(idx):
+    return _serializer("checkin-stamp").dumps({"s": idx})
+
+
+def scanner_token(idx):
+    return _serializer("checkin-scanner").dumps({"s": idx})
+
+
+def pass_token(user_id):
+    return _serializer("checkin-pass").dumps({"u": user_id})
+
+
+def verify_stamp(token):
+    return _load("checkin-stamp", token, STAMP_MAX_AGE)["s"]
+
+
+def verify_scanner(token):
+    return _load("checkin-scanner", token, SCANNER_MAX_AGE)["s"]
+
+
+def verify_pass(token):
+    return _load("checkin-pass", token, PASS_MAX_AGE)["u"]
+
+
+def qr_svg(data):
+    """把字符串渲染成 SVG 二维码；没装 qrcode 时返回 None。"""
+    if qrcode is None:
+        return None
+    img = qrcode.make(data, image_factory=qrcode.image.svg.SvgPathImage, box_size=12, border=2)
+    buf = io.BytesIO()
+    img.save(buf)
+    return buf.getvalue().decode("utf-8")
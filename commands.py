@@ -0,0 +1,368 @@
+"""批量管理命令（Flask CLI），和网站共用 db.py，SQLite / PostgreSQL 都可以用：
+
+    flask --app App import-users candidates.csv
+    flask --app App award-stamps booth2.jsonl --stamp 2
+    flask --app App revoke-stamps mistakes.csv --dry-run
+    flask --app App clear-stamps cc
+    flask --app App rebuild-counters
+
+输入文件逐行读取（CSV 或 JSON Lines，``-`` 表示标准输入），每 ``--batch-size`` 行
+一个事务：先用 ``db.copy_rows`` 写进临时表（PostgreSQL 走 COPY，SQLite 走
+executemany），再用一条集合 SQL 合并到正式表，不逐行往返。
+
+导入的明文密码按 ``--password-method``（默认 ``IMPORT_PASSWORD_METHOD``，
+低成本的 pbkdf2）哈希后再写入，用 ``HASH_THREADS`` 个线程并行；已经是 werkzeug
+哈希格式的值原样写入。按 ``PASSWORD_HASH_METHOD`` 的完整成本逐行计算太慢
+（scrypt:32768 每行约 0.1 秒），这些哈希会在用户下一次登录成功时按网站的参数重算。
+
+``--dry-run`` 照常执行每一批再回滚，输出的数字就是实际执行会产生的变化
+（批与批之间看不到彼此的修改）。汇总计数由触发器维护，不需要额外处理。
+"""
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import click
+
+import counters
+import db
+import passwords
+import stamps
+
+BATCH_SIZE = 5000
+HASH_THREADS = int(os.environ.get("IMPORT_HASH_THREADS", os.cpu_count() or 1))
+IMPORT_PASSWORD_METHOD = os.environ.get("IMPORT_PASSWORD_METHOD", "pbkdf2:sha256:1000")
+
+USER_STAGE = """
+    CREATE TEMP TABLE IF NOT EXISTS stage_users (
+        seq INTEGER, name TEXT, email TEXT, phone TEXT, password TEXT
+    )
+"""
+STAMP_STAGE = """
+    CREATE TEMP TABLE IF NOT EXISTS stage_stamps (
+        user_id INTEGER, email TEXT, name TEXT, stamp_idx INTEGER
+    )
+"""
+
+
+@contextmanager
+def _open_input(path):
+    if path == "-":
+        yield sys.stdin
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield f
+
+
+def read_records(path, fmt="auto"):
+    """逐条产出 dict；CSV 按表头取列，JSON Lines 每行一个对象。"""
+    if fmt == "auto":
+        fmt = "jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson", ".json") else "csv"
+    with _open_input(path) as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+            return
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise click.ClickException("line %d: invalid JSON" % lineno)
+            if not isinstance(record, dict):
+                raise click.ClickException("line %d: expected a JSON object" % lineno)
+            yield record
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _text(record, key):
+    value = record.get(key)
+    return str(value).strip() if value is not None else ""
+
+
+def run_batches(records, handle, batch_size=BATCH_SIZE, dry_run=False, label="rows"):
+    """每批一个事务调用 ``handle(conn, chunk)``，累加它返回的计数并输出进度。"""
+    totals = {}
+    start = time.perf_counter()
+    with db.get_database().connection() as conn:
+        for number, chunk in enumerate(_chunks(records, batch_size), 1):
+            try:
+                result = handle(conn, chunk)
+            except Exception:
+                conn.rollback()
+                raise
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+            for key, value in result.items():
+                totals[key] = totals.get(key, 0) + value
+            elapsed = time.perf_counter() - start
+            click.echo(
+                "%s batch %d: %s (%.0f %s/s)"
+                % ("[dry-run] " if dry_run else "", number, _format(totals), totals.get("read", 0) / elapsed, label),
+                err=True,
+            )
+    return totals
+
+
+def _format(totals):
+    return ", ".join("%s %d" % (key, value) for key, value in totals.items())
+
+
+def _hash_one(password, method=None):
+    return password if passwords.is_hash(password) else passwords.hash_sync(password, method)
+
+
+def _hash_passwords(rows, method=None):
+    """把每行最后一列的密码换成哈希；hashlib 计算时释放 GIL，多线程可以用满多核。"""
+    with ThreadPoolExecutor(max_workers=HASH_THREADS) as executor:
+        hashed = list(executor.map(lambda password: _hash_one(password, method), [row[-1] for row in rows]))
+    return [row[:-1] + (password,) for row, password in zip(rows, hashed)]
+
+
+def import_users_batch(conn, records, password_method=None):
+    rows = []
+    invalid = 0
+    for seq, record in enumerate(records):
+        name = _text(record, "name")
+        password = _text(record, "password")
+        # 与注册页面相同的规则：姓名必填，密码至少 6 位
+        if not name or len(password) < 6:
+            invalid += 1
+            continue
+        rows.append((seq, name, _text(record, "email") or None, _text(record, "phone"), password))
+    rows = _hash_passwords(rows, password_method)
+    db.execute(USER_STAGE, conn=conn)
+    db.execute("DELETE FROM stage_users", conn=conn)
+    db.copy_rows("stage_users", ["seq", "name", "email", "phone", "password"], rows, conn=conn)
+    # 重名 / 重复邮箱（包括同一批里的重复）由唯一索引跳过
+    cur = db.execute(
+        """
+        INSERT INTO users (name, email, phone, password)
+        SELECT name, email, phone, password FROM stage_users WHERE true ORDER BY seq
+        ON CONFLICT DO NOTHING
+        """,
+        conn=conn,
+    )
+    imported = cur.rowcount
+    return {"read": len(records), "imported": imported, "duplicates": len(rows) - imported, "invalid": invalid}
+
+
+def _stage_stamps(conn, records, default_stamp=None, any_stamp=False):
+    """把 (用户, 印章) 写进 stage_stamps 并解析出 user_id，返回 (无效行数, 找不到的用户数)。
+
+    用户可以用 user_id、email、name 或 account（和登录一样，含 @ 时先按邮箱再按姓名）指定；
+    ``any_stamp`` 为 True 时不要求印章列。
+    """
+    rows = []
+    invalid = 0
+    for record in records:
+        stamp = record.get("stamp", record.get("stamp_idx", default_stamp))
+        try:
+            stamp = int(stamp)
+        except (TypeError, ValueError):
+            stamp = None
+        user_id = _text(record, "user_id")
+        email = _text(record, "email")
+        name = _text(record, "name")
+        account = _text(record, "account")
+        if account:
+            if "@" in account:
+                email = email or account
+            name = name or account
+        valid_stamp = any_stamp or (stamp is not None and stamps.is_valid(stamp))
+        if not valid_stamp or not (user_id.isdigit() or email or name):
+            invalid += 1
+            continue
+        rows.append((int(user_id) if user_id.isdigit() else None, email or None, name or None, stamp))
+
+    db.execute(STAMP_STAGE, conn=conn)
+    db.execute("DELETE FROM stage_stamps", conn=conn)
+    db.copy_rows("stage_stamps", ["user_id", "email", "name", "stamp_idx"], rows, conn=conn)
+    db.execute(
+        """
+        UPDATE stage_stamps SET user_id = (SELECT id FROM users WHERE lower(users.email) = lower(stage_stamps.email))
+        WHERE user_id IS NULL AND email IS NOT NULL
+        """,
+        conn=conn,
+    )
+    db.execute(
+        """
+        UPDATE stage_stamps SET user_id = (SELECT id FROM users WHERE lower(users.name) = lower(stage_stamps.name))
+        WHERE user_id IS NULL AND name IS NOT NULL
+        """,
+        conn=conn,
+    )
+    unknown = db.query_one(
+        "SELECT COUNT(*) AS n FROM stage_stamps s WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.id = s.user_id)",
+        conn=conn,
+    )["n"]
+    return invalid, unknown
+
+
+def award_stamps_batch(conn, records, default_stamp=None):
+    invalid, unknown = _stage_stamps(conn, records, default_stamp)
+    cur = db.execute(
+        """
+        INSERT INTO user_stamps (user_id, stamp_idx)
+        SELECT DISTINCT u.id, s.stamp_idx FROM stage_stamps s JOIN users u ON u.id = s.user_id WHERE true
+        ON CONFLICT (user_id, stamp_idx) DO NOTHING
+        """,
+        conn=conn,
+    )
+    return {"read": len(records), "awarded": cur.rowcount, "unknown_users": unknown, "invalid": invalid}
+
+
+def revoke_stamps_batch(conn, records, default_stamp=None):
+    invalid, unknown = _stage_stamps(conn, records, default_stamp)
+    cur = db.execute(
+        "DELETE FROM user_stamps WHERE (user_id, stamp_idx) IN (SELECT user_id, stamp_idx FROM stage_stamps)",
+        conn=conn,
+    )
+    return {"read": len(records), "revoked": cur.rowcount, "unknown_users": unknown, "invalid": invalid}
+
+
+def clear_stamps(accounts, stamp=None, dry_run=False):
+    """清空指定用户（姓名或邮箱）的印章，``stamp`` 只清某一个。返回 (删除数, 找不到的账号)。"""
+    with db.get_database().connection() as conn:
+        _stage_stamps(conn, [{"account": account} for account in accounts], any_stamp=True)
+        missing = [
+            row["name"]
+            for row in db.query_all(
+                "SELECT name FROM stage_stamps s WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.id = s.user_id)",
+                conn=conn,
+            )
+        ]
+        sql = "DELETE FROM user_stamps WHERE user_id IN (SELECT user_id FROM stage_stamps)"
+        params = ()
+        if stamp is not None:
+            sql += " AND stamp_idx = ?"
+            params = (stamp,)
+        deleted = db.execute(sql, params, conn=conn).rowcount
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    return deleted, missing
+
+
+def _input_options(fn):
+    fn = click.option("--dry-run", is_flag=True, help="Run every batch, then roll it back.")(fn)
+    fn = click.option("--batch-size", default=BATCH_SIZE, show_default=True, help="Rows per transaction.")(fn)
+    fn = click.option("--format", "fmt", type=click.Choice(["auto", "csv", "jsonl"]), default="auto", show_default=True)(fn)
+    fn = click.argument("path")(fn)
+    return fn
+
+
+@click.command("import-users")
+@_input_options
+@click.option(
+    "--password-method",
+    default=IMPORT_PASSWORD_METHOD,
+    show_default=True,
+    help="werkzeug hash method for plaintext passwords; upgraded to PASSWORD_HASH_METHOD on next login.",
+)
+def import_users_command(path, fmt, batch_size, dry_run, password_method):
+    """Import users from CSV/JSONL with name, email, phone, password columns."""
+    try:
+        passwords.hash_sync("", password_method)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="--password-method")
+    totals = run_batches(
+        read_records(path, fmt),
+        lambda conn, chunk: import_users_batch(conn, chunk, password_method),
+        batch_size,
+        dry_run,
+        "rows",
+    )
+    click.echo(_format(totals) or "no rows")
+
+
+@click.command("award-stamps")
+@_input_options
+@click.option("--stamp", type=int, help="Stamp index for rows without a stamp column.")
+def award_stamps_command(path, fmt, batch_size, dry_run, stamp):
+    """Award stamps to users given by user_id, email, name or account."""
+    totals = run_batches(
+        read_records(path, fmt), lambda conn, chunk: award_stamps_batch(conn, chunk, stamp), batch_size, dry_run, "rows"
+    )
+    click.echo(_format(totals) or "no rows")
+
+
+@click.command("revoke-stamps")
+@_input_options
+@click.option("--stamp", type=int, help="Stamp index for rows without a stamp column.")
+def revoke_stamps_command(path, fmt, batch_size, dry_run, stamp):
+    """Revoke stamps from users given by user_id, email, name or account."""
+    totals = run_batches(
+        read_records(path, fmt), lambda conn, chunk: revoke_stamps_batch(conn, chunk, stamp), batch_size, dry_run, "rows"
+    )
+    click.echo(_format(totals) or "no rows")
+
+
+@click.command("clear-stamps")
+@click.argument("accounts", nargs=-1)
+@click.option("--all", "all_users", is_flag=True, help="Clear stamps of every user.")
+@click.option("--stamp", type=int, help="Only clear this stamp index.")
+@click.option("--dry-run", is_flag=True)
+@click.option("--yes", is_flag=True, help="Do not ask for confirmation with --all.")
+def clear_stamps_command(accounts, all_users, stamp, dry_run, yes):
+    """Clear stamps of the given users (name or email), or of everyone with --all."""
+    if stamp is not None and not stamps.is_valid(stamp):
+        raise click.BadParameter("unknown stamp %d" % stamp, param_hint="--stamp")
+    if all_users == bool(accounts):
+        raise click.UsageError("give either account names or --all")
+    if all_users:
+        if not dry_run and not yes:
+            click.confirm("Clear %s for ALL users?" % ("stamp %d" % stamp if stamp is not None else "all stamps"), abort=True)
+        with db.get_database().connection() as conn:
+            if stamp is None:
+                deleted = db.execute("DELETE FROM user_stamps", conn=conn).rowcount
+            else:
+                deleted = db.execute("DELETE FROM user_stamps WHERE stamp_idx = ?", (stamp,), conn=conn).rowcount
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        missing = []
+    else:
+        deleted, missing = clear_stamps(accounts, stamp, dry_run)
+    for account in missing:
+        click.echo("no such user: %s" % account, err=True)
+    click.echo("%sremoved %d stamp(s)" % ("[dry-run] " if dry_run else "", deleted))
+
+
+@click.command("rebuild-counters")
+def rebuild_counters_command():
+    """Recompute dashboard counters from users and user_stamps."""
+    with db.get_database().connection() as conn:
+        values = counters.rebuild(conn)
+        conn.commit()
+    click.echo(_format(values))
+
+
+def init_app(app):
+    for command in (
+        import_users_command,
+        award_stamps_command,
+        revoke_stamps_command,
+        clear_stamps_command,
+        rebuild_counters_command,
+    ):
+        app.cli.add_command(command)
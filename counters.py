@@ -0,0 +1,323 @@
+"""活动现场的汇总计数：总人数、每个印章的完成人数、集满人数、每分钟注册数。
+
+计数由数据库触发器在写入时增量维护，所有写入路径（注册、发章、write-behind
+批量写、扫码枪批量上传、删除用户时的级联删除）都自动覆盖，读取时只需查
+几行，不用再对 users / user_stamps 做聚合：
+
+- ``event_counters(name, value)``：``users_total``、``stamp_0`` … ``stamp_N``、``full_card``
+- ``event_counter_deltas(id, name, delta)``：PostgreSQL 上触发器追加的增量，读取时
+  和 ``event_counters`` 相加，``compact()`` 定期把它们并回 ``event_counters``
+- ``signups_per_minute(minute, count)``：minute 为 Unix 时间 // 60；PostgreSQL 上新注册
+  先追加到 ``signup_deltas(id, minute, count)``，同样读取时相加、定期合并
+
+SQLite 使用行级触发器直接更新计数行（写入本来就是串行的）。PostgreSQL 使用带转换表
+的语句级触发器，只往增量表里插入新行：并发的发章事务不会去更新同几行计数、互相
+排队或按不同顺序加锁而死锁。补齐最后一个印章的判断需要锁住用户行，避免两个事务
+同时补齐同一个用户的最后两个印章时都没有算进集满人数：行级 BEFORE 触发器在写入
+``user_stamps`` 之前加锁（写入之后再锁，会和等待同一主键的事务互相等待）；
+``stamps.award_many`` 按用户排序写入，所有批次按同一顺序加锁。
+
+增量由每个进程一个后台线程每 ``COUNTER_COMPACT_SECONDS`` 秒合并一次（``init_app``
+在第一个请求时启动），没人打开管理页面时增量表也不会一直变大。
+"""
+import logging
+import os
+import threading
+import time
+
+import db
+import stamps
+
+logger = logging.getLogger(__name__)
+
+COMPACT_SECONDS = float(os.environ.get("COUNTER_COMPACT_SECONDS", 10))
+COMPACT_LOCK_KEY = 727_002  # 同一时间只让一个进程合并增量（pg_try_advisory_xact_lock）
+
+USERS_TOTAL = "users_total"
+FULL_CARD = "full_card"
+STAMP_NAMES = ["stamp_%d" % i for i in range(stamps.STAMP_COUNT)]
+NAMES = [USERS_TOTAL] + STAMP_NAMES + [FULL_CARD]
+
+_SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_users_counters_insert AFTER INSERT ON users
+    BEGIN
+        UPDATE event_counters SET value = value + 1 WHERE name = 'users_total';
+        INSERT INTO signups_per_minute (minute, count) VALUES (CAST(strftime('%%s', 'now') AS INTEGER) / 60, 1)
+        ON CONFLICT (minute) DO UPDATE SET count = signups_per_minute.count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_users_counters_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE event_counters SET value = value - 1 WHERE name = 'users_total';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_user_stamps_counters_insert AFTER INSERT ON user_stamps
+    BEGIN
+        UPDATE event_counters SET value = value + 1 WHERE name = 'stamp_' || NEW.stamp_idx;
+        UPDATE event_counters SET value = value + 1 WHERE name = 'full_card'
+            AND (SELECT COUNT(*) FROM user_stamps WHERE user_id = NEW.user_id) = %(count)d;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_user_stamps_counters_delete AFTER DELETE ON user_stamps
+    BEGIN
+        UPDATE event_counters SET value = value - 1 WHERE name = 'stamp_' || OLD.stamp_idx;
+        UPDATE event_counters SET value = value - 1 WHERE name = 'full_card'
+            AND (SELECT COUNT(*) FROM user_stamps WHERE user_id = OLD.user_id) = %(count)d - 1;
+    END
+    """,
+]
+
+_POSTGRES_TRIGGERS = [
+    """
+    CREATE OR REPLACE FUNCTION counters_users_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO event_counter_deltas (name, delta)
+        SELECT 'users_total', COUNT(*) FROM new_rows HAVING COUNT(*) > 0;
+        INSERT INTO signup_deltas (minute, count)
+        SELECT floor(extract(epoch FROM now()) / 60)::bigint, COUNT(*) FROM new_rows HAVING COUNT(*) > 0;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION counters_users_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO event_counter_deltas (name, delta)
+        SELECT 'users_total', -COUNT(*) FROM old_rows HAVING COUNT(*) > 0;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION counters_user_stamps_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        completed bigint;
+    BEGIN
+        INSERT INTO event_counter_deltas (name, delta)
+        SELECT 'stamp_' || stamp_idx, COUNT(*) FROM new_rows GROUP BY stamp_idx;
+        SELECT COUNT(*) INTO completed FROM (SELECT DISTINCT user_id FROM new_rows) u
+        WHERE (SELECT COUNT(*) FROM user_stamps s WHERE s.user_id = u.user_id) = %(count)d;
+        IF completed > 0 THEN
+            INSERT INTO event_counter_deltas (name, delta) VALUES ('full_card', completed);
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION counters_user_stamps_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        broken bigint;
+    BEGIN
+        INSERT INTO event_counter_deltas (name, delta)
+        SELECT 'stamp_' || stamp_idx, -COUNT(*) FROM old_rows GROUP BY stamp_idx;
+        SELECT COUNT(*) INTO broken FROM (SELECT user_id, COUNT(*) AS k FROM old_rows GROUP BY user_id) d
+        WHERE (SELECT COUNT(*) FROM user_stamps s WHERE s.user_id = d.user_id) + d.k = %(count)d;
+        IF broken > 0 THEN
+            INSERT INTO event_counter_deltas (name, delta) VALUES ('full_card', -broken);
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION counters_lock_user() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM 1 FROM users WHERE id = OLD.user_id FOR NO KEY UPDATE;
+            RETURN OLD;
+        END IF;
+        PERFORM 1 FROM users WHERE id = NEW.user_id FOR NO KEY UPDATE;
+        RETURN NEW;
+    END $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_user_stamps_lock_user ON user_stamps",
+    """
+    CREATE TRIGGER trg_user_stamps_lock_user BEFORE INSERT OR DELETE ON user_stamps
+    FOR EACH ROW EXECUTE FUNCTION counters_lock_user()
+    """,
+    "DROP TRIGGER IF EXISTS trg_users_counters_insert ON users",
+    """
+    CREATE TRIGGER trg_users_counters_insert AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION counters_users_insert()
+    """,
+    "DROP TRIGGER IF EXISTS trg_users_counters_delete ON users",
+    """
+    CREATE TRIGGER trg_users_counters_delete AFTER DELETE ON users
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION counters_users_delete()
+    """,
+    "DROP TRIGGER IF EXISTS trg_user_stamps_counters_insert ON user_stamps",
+    """
+    CREATE TRIGGER trg_user_stamps_counters_insert AFTER INSERT ON user_stamps
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION counters_user_stamps_insert()
+    """,
+    "DROP TRIGGER IF EXISTS trg_user_stamps_counters_delete ON user_stamps",
+    """
+    CREATE TRIGGER trg_user_stamps_counters_delete AFTER DELETE ON user_stamps
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION counters_user_stamps_delete()
+    """,
+]
+
+
+def create_tables(conn):
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS event_counters (name TEXT PRIMARY KEY, value BIGINT NOT NULL DEFAULT 0)",
+        conn=conn,
+    )
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS signups_per_minute (minute BIGINT PRIMARY KEY, count INTEGER NOT NULL DEFAULT 0)",
+        conn=conn,
+    )
+    # 增量表在 SQLite 上始终为空，建出来只是为了读取用同一条 SQL
+    serial = "BIGSERIAL PRIMARY KEY" if db.is_postgres() else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS event_counter_deltas (id %s, name TEXT NOT NULL, delta BIGINT NOT NULL)" % serial,
+        conn=conn,
+    )
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS signup_deltas (id %s, minute BIGINT NOT NULL, count BIGINT NOT NULL)" % serial,
+        conn=conn,
+    )
+
+
+def create_triggers(conn):
+    statements = _POSTGRES_TRIGGERS if db.is_postgres() else _SQLITE_TRIGGERS
+    for sql in statements:
+        db.execute(sql % {"count": stamps.STAMP_COUNT}, conn=conn)
+
+
+def rebuild(conn):
+    """按 users / user_stamps 重新计算计数（初次建表或怀疑不一致时用）。调用方负责 commit。
+
+    每分钟注册数没有历史数据可算，保持原样。
+    """
+    if db.is_postgres():
+        # 重算期间挡住写入，否则统计之后、清空增量之前提交的发章会被漏掉
+        db.execute("LOCK TABLE users, user_stamps IN SHARE MODE", conn=conn)
+    db.execute("DELETE FROM event_counter_deltas", conn=conn)
+    values = dict.fromkeys(NAMES, 0)
+    values[USERS_TOTAL] = db.query_one("SELECT COUNT(*) AS n FROM users", conn=conn)["n"]
+    for row in db.query_all("SELECT stamp_idx, COUNT(*) AS n FROM user_stamps GROUP BY stamp_idx", conn=conn):
+        if stamps.is_valid(row["stamp_idx"]):
+            values[STAMP_NAMES[row["stamp_idx"]]] = row["n"]
+    values[FULL_CARD] = db.query_one(
+        "SELECT COUNT(*) AS n FROM (SELECT user_id FROM user_stamps GROUP BY user_id HAVING COUNT(*) >= ?) t",
+        (stamps.STAMP_COUNT,),
+        conn=conn,
+    )["n"]
+    db.executemany(
+        "INSERT INTO event_counters (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value",
+        list(values.items()),
+        conn=conn,
+    )
+    return values
+
+
+def read(conn=None):
+    """返回 {计数名: 值}。"""
+    values = dict.fromkeys(NAMES, 0)
+    rows = db.query_all(
+        """
+        SELECT name, CAST(SUM(value) AS BIGINT) AS value FROM (
+            SELECT name, value FROM event_counters
+            UNION ALL
+            SELECT name, delta FROM event_counter_deltas
+        ) t GROUP BY name
+        """,
+        conn=conn,
+    )
+    for row in rows:
+        values[row["name"]] = row["value"]
+    return values
+
+
+def compact():
+    """把增量并回 ``event_counters`` / ``signups_per_minute``，返回合并的增量行数。
+
+    只在 PostgreSQL 上有增量。每张表一条语句删除并累加，读取方看到的总和不会变化；
+    同一时间只有一个进程在合并，计数行的更新不会和别的合并交错加锁。
+    """
+    if not db.is_postgres():
+        return 0
+    with db.get_database().connection() as conn:
+        if not db.query_one("SELECT pg_try_advisory_xact_lock(?) AS ok", (COMPACT_LOCK_KEY,), conn=conn)["ok"]:
+            conn.rollback()
+            return 0
+        row = db.query_one(
+            """
+            WITH moved AS (
+                DELETE FROM event_counter_deltas RETURNING name, delta
+            ), totals AS (
+                SELECT name, SUM(delta) AS delta, COUNT(*) AS n FROM moved GROUP BY name
+            ), merged AS (
+                -- 带数据修改的 WITH 子句无论是否被引用都会执行
+                INSERT INTO event_counters (name, value) SELECT name, delta FROM totals
+                ON CONFLICT (name) DO UPDATE SET value = event_counters.value + EXCLUDED.value
+            )
+            SELECT COALESCE(SUM(n), 0) AS n FROM totals
+            """,
+            conn=conn,
+        )
+        signup_row = db.query_one(
+            """
+            WITH moved AS (
+                DELETE FROM signup_deltas RETURNING minute, count
+            ), totals AS (
+                SELECT minute, SUM(count) AS count, COUNT(*) AS n FROM moved GROUP BY minute
+            ), merged AS (
+                INSERT INTO signups_per_minute (minute, count) SELECT minute, count FROM totals
+                ON CONFLICT (minute) DO UPDATE SET count = signups_per_minute.count + EXCLUDED.count
+            )
+            SELECT COALESCE(SUM(n), 0) AS n FROM totals
+            """,
+            conn=conn,
+        )
+        conn.commit()
+    return int(row["n"]) + int(signup_row["n"])
+
+
+_compactor = None
+_compactor_pid = None
+_compactor_lock = threading.Lock()
+
+
+def _compact_loop():
+    while True:
+        time.sleep(COMPACT_SECONDS)
+        try:
+            compact()
+        except Exception:
+            logger.exception("compacting counter deltas failed")
+
+
+def start_compactor():
+    """本进程还没有合并线程时启动一个（gunicorn fork 之后按 pid 重新启动）。"""
+    global _compactor, _compactor_pid
+    if _compactor_pid == os.getpid() or not db.is_postgres():
+        return
+    with _compactor_lock:
+        if _compactor_pid != os.getpid():
+            _compactor = threading.Thread(target=_compact_loop, name="counter-compactor", daemon=True)
+            _compactor.start()
+            _compactor_pid = os.getpid()
+
+
+def init_app(app):
+    app.before_request(start_compactor)
+
+
+def signups(minutes=30, conn=None):
+    """最近 ``minutes`` 分钟每分钟的注册数 {minute: count}，没有注册的分钟不出现。"""
+    since = int(time.time()) // 60 - minutes + 1
+    rows = db.query_all(
+        """
+        SELECT minute, CAST(SUM(count) AS BIGINT) AS count FROM (
+            SELECT minute, count FROM signups_per_minute WHERE minute >= ?
+            UNION ALL
+            SELECT minute, count FROM signup_deltas WHERE minute >= ?
+        ) t GROUP BY minute ORDER BY minute
+        """,
+        (since, since),
+        conn=conn,
+    )
+    return {row["minute"]: row["count"] for row in rows}
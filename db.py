@@ -0,0 +1,450 @@
+"""数据库访问层。
+
+每个进程维护一个有上限的连接池（PostgreSQL 使用 psycopg2 的线程池，SQLite 使用
+每线程一条长连接 + WAL），路由通过 Flask 的 ``g`` 按请求借出连接，请求结束时在
+teardown 中归还。查询统一写 ``?`` 占位符，由本模块按当前数据库改写。
+"""
+import io
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from flask import g
+
+import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SQLITE_PATH = os.path.join(BASE_DIR, "users.db")
+
+try:
+    import psycopg2
+    import psycopg2.pool
+    from psycopg2.extras import RealDictCursor
+except ImportError:  # 本地开发只用 SQLite 时可以不装 psycopg2
+    psycopg2 = None
+
+
+# 游标包装：每条语句计时，按语句形状计入 metrics，并记录慢查询
+class TimedSQLiteCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - start)
+
+
+class TimedSQLiteConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedSQLiteCursor):
+        return super().cursor(factory)
+
+
+if psycopg2 is not None:
+
+    class TimedDictCursor(RealDictCursor):
+        def execute(self, query, vars=None):
+            start = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                metrics.observe_query(query, time.perf_counter() - start)
+
+        def executemany(self, query, vars_list):
+            start = time.perf_counter()
+            try:
+                return super().executemany(query, vars_list)
+            finally:
+                metrics.observe_query(query, time.perf_counter() - start)
+
+        def copy_expert(self, sql, file, size=8192):
+            start = time.perf_counter()
+            try:
+                return super().copy_expert(sql, file, size)
+            finally:
+                metrics.observe_query(sql, time.perf_counter() - start)
+
+# 路由里统一捕获这个元组即可，不必关心当前是哪种数据库
+if psycopg2 is not None:
+    IntegrityError = (sqlite3.IntegrityError, psycopg2.IntegrityError)
+    DatabaseError = (sqlite3.DatabaseError, psycopg2.Error)
+else:
+    IntegrityError = (sqlite3.IntegrityError,)
+    DatabaseError = (sqlite3.DatabaseError,)
+
+
+class PoolTimeout(RuntimeError):
+    """连接池在等待时间内没有空闲连接。"""
+
+
+@lru_cache(maxsize=512)
+def convert_placeholders(sql, dialect, has_params=True):
+    """把 ``?`` 占位符改写成当前数据库的写法（跳过字符串字面量里的问号）。
+
+    psycopg2 只在带参数时做 ``%`` 格式化，所以只有这时才需要把字面量 ``%`` 转义。
+    """
+    if dialect != "postgres":
+        return sql
+    pct = "%%" if has_params else "%"
+    out = []
+    quote = None
+    for ch in sql:
+        if quote:
+            out.append(pct if ch == "%" else ch)
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+            out.append(ch)
+        elif ch == "?":
+            out.append("%s")
+        elif ch == "%":
+            out.append(pct)
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class _ThreadToken:
+    """只被线程本地变量引用；线程结束时被回收，触发关闭该线程的连接。"""
+
+
+class SQLitePool:
+    """SQLite 每个线程复用一条长连接，开启 WAL 让读写互不阻塞。
+
+    连接跟着线程走：线程结束时（每个请求一个线程的开发服务器、实时面板重新启动的
+    轮询线程）由 weakref.finalize 关闭，不会越积越多。
+    """
+
+    dialect = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = {}  # id(conn) -> conn，close() 时统一关闭
+
+    def _connect(self):
+        # 连接只在创建它的线程里使用；关闭可能发生在别的线程（线程清理、close()）
+        conn = sqlite3.connect(self.path, timeout=10, factory=TimedSQLiteConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-16000")  # 约 16MB 页缓存
+        conn.execute("PRAGMA mmap_size=134217728")
+        with self._lock:
+            self._open[id(conn)] = conn
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._open.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            self._local.depth = 0
+            self._local.token = token = _ThreadToken()
+            weakref.finalize(token, self._discard, conn)
+        self._local.depth += 1
+        return conn
+
+    def release(self, conn, broken=False):
+        self._local.depth -= 1
+        # 同一线程可能嵌套借出；最外层归还时丢弃未提交的事务
+        if self._local.depth == 0 and conn.in_transaction:
+            conn.rollback()
+
+    def open_connections(self):
+        with self._lock:
+            return len(self._open)
+
+    def close(self):
+        with self._lock:
+            conns = list(self._open.values())
+            self._open.clear()
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+class PostgresPool:
+    """psycopg2 线程池外面加一个信号量，池满时排队等待而不是直接报错。"""
+
+    dialect = "postgres"
+
+    def __init__(self, url, minconn, maxconn, timeout):
+        if psycopg2 is None:
+            raise RuntimeError("psycopg2 is required for PostgreSQL DATABASE_URL")
+        parsed = urlparse(url)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn,
+            maxconn,
+            host=parsed.hostname,
+            port=parsed.port,
+            user=parsed.username,
+            password=parsed.password,
+            database=parsed.path[1:],  # 去掉开头的/
+            cursor_factory=TimedDictCursor,
+        )
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout("no database connection available within %ss" % self.timeout)
+        try:
+            conn = self._pool.getconn()
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        return conn
+
+    def release(self, conn, broken=False):
+        try:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            self._pool.putconn(conn, close=broken or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self._pool.closeall()
+
+
+class Database:
+    def __init__(self, url=None):
+        self.url = url if url is not None else os.environ.get("DATABASE_URL", "")
+        if self.url.startswith(("postgres://", "postgresql://")) and psycopg2 is None:
+            print("Warning: psycopg2 not installed, falling back to SQLite")
+            self.url = ""
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def dialect(self):
+        return "postgres" if self.url.startswith(("postgres://", "postgresql://")) else "sqlite"
+
+    @property
+    def sqlite_path(self):
+        if self.url.startswith("sqlite:///"):
+            path = self.url[len("sqlite:///"):]
+            return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+        return DEFAULT_SQLITE_PATH
+
+    @property
+    def pool(self):
+        # gunicorn fork 出 worker 后必须重建连接池，不能共用父进程的 socket
+        pid = os.getpid()
+        if self._pool is None or self._pid != pid:
+            with self._lock:
+                if self._pool is None or self._pid != pid:
+                    if self.dialect == "postgres":
+                        self._pool = PostgresPool(
+                            self.url,
+                            _env_int("DB_POOL_MIN", 1),
+                            _env_int("DB_POOL_MAX", 10),
+                            _env_int("DB_POOL_TIMEOUT", 10),
+                        )
+                    else:
+                        self._pool = SQLitePool(self.sqlite_path)
+                    self._pid = pid
+        return self._pool
+
+    def acquire(self):
+        start = time.perf_counter()
+        try:
+            return self.pool.acquire()
+        except PoolTimeout:
+            metrics.inc("db_pool_timeouts_total", {})
+            raise
+        finally:
+            metrics.observe_pool_wait(time.perf_counter() - start)
+
+    def release(self, conn, broken=False):
+        self.pool.release(conn, broken)
+
+    @contextmanager
+    def connection(self):
+        """在请求之外（脚本、后台线程）借出一条连接。"""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = _is_connection_error(conn)
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def close(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.close()
+        self._pool = None
+
+
+def _is_connection_error(conn):
+    return psycopg2 is not None and isinstance(conn, psycopg2.extensions.connection) and bool(conn.closed)
+
+
+_database = None
+
+
+def get_database():
+    global _database
+    if _database is None:
+        _database = Database()
+    return _database
+
+
+def configure(url=None):
+    """切换数据库（测试、基准脚本使用）。"""
+    global _database
+    if _database is not None:
+        _database.close()
+    _database = Database(url)
+    return _database
+
+
+def is_postgres():
+    return get_database().dialect == "postgres"
+
+
+def get_db():
+    """返回当前请求借出的连接，第一次调用时才从池里取。"""
+    if "db_conn" not in g:
+        g.db_conn = get_database().acquire()
+    return g.db_conn
+
+
+def close_db(exc=None):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        get_database().release(conn, exc is not None and _is_connection_error(conn))
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
+
+def execute(sql, params=(), conn=None):
+    conn = conn if conn is not None else get_db()
+    cur = conn.cursor()
+    if params:
+        cur.execute(convert_placeholders(sql, get_database().dialect), params)
+    else:
+        cur.execute(convert_placeholders(sql, get_database().dialect, False))
+    return cur
+
+
+def executemany(sql, seq_of_params, conn=None):
+    conn = conn if conn is not None else get_db()
+    cur = conn.cursor()
+    cur.executemany(convert_placeholders(sql, get_database().dialect), seq_of_params)
+    return cur
+
+
+def _copy_field(value):
+    # COPY 的 CSV 格式里不加引号的空字段是 NULL，空字符串要写成 ""
+    if value is None:
+        return ""
+    return '"%s"' % str(value).replace('"', '""')
+
+
+def copy_rows(table, columns, rows, conn=None):
+    """把一批行写入 ``table``：PostgreSQL 用 COPY，SQLite 用 executemany。调用方负责 commit。"""
+    conn = conn if conn is not None else get_db()
+    cur = conn.cursor()
+    if get_database().dialect == "postgres":
+        buf = io.StringIO()
+        for row in rows:
+            buf.write(",".join(_copy_field(v) for v in row))
+            buf.write("\n")
+        buf.seek(0)
+        cur.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (table, ", ".join(columns)), buf)
+    else:
+        cur.executemany(
+            "INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(columns), ", ".join("?" * len(columns))), rows
+        )
+    return cur
+
+
+def stream(sql, params=(), batch_size=1000):
+    """逐批读取大结果集，内存占用与总行数无关。
+
+    PostgreSQL 使用服务端命名游标；SQLite 的游标本身就是惰性的。生成器自己借一条
+    连接，这样即使响应在请求上下文结束后才流完也不受影响。
+    """
+    database = get_database()
+    with database.connection() as conn:
+        if database.dialect == "postgres":
+            cur = conn.cursor(name="stream_%d" % threading.get_ident())
+            cur.itersize = batch_size
+        else:
+            cur = conn.cursor()
+        try:
+            if params:
+                cur.execute(convert_placeholders(sql, database.dialect), params)
+            else:
+                cur.execute(convert_placeholders(sql, database.dialect, False))
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cur.close()
+
+
+def query_one(sql, params=(), conn=None):
+    return execute(sql, params, conn).fetchone()
+
+
+def query_all(sql, params=(), conn=None):
+    return execute(sql, params, conn).fetchall()
+
+
+def commit():
+    if "db_conn" in g:
+        g.db_conn.commit()
+
+
+def rollback():
+    if "db_conn" in g:
+        g.db_conn.rollback()
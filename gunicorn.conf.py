@@ -0,0 +1,33 @@
+# gunicorn 会自动读取当前目录下的这个文件（Procfile: gunicorn App:app）
+import os
+
+# gthread：每个请求一个线程。管理员实时面板的 SSE 长连接只占一个线程，
+# 不会像 sync worker 那样占住整个进程（也不会被 worker 超时杀掉）
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+
+def on_starting(server):
+    # 新部署开始时清掉上一轮 worker 留下的指标快照
+    import metrics
+
+    metrics.clear()
+
+    # 在 fork worker 之前迁移一次；worker 导入 App 时只剩一次版本查询
+    import db
+    import migrations
+
+    migrations.run()
+    db.get_database().close()  # 不把 master 的连接带进 worker
+
+    # 响应式图片也在这里生成一次，worker 不用在导入时排队等锁
+    import images
+
+    images.load()
+
+
+def worker_exit(server, worker):
+    # worker 退出前把 write-behind 队列里还没落库的印章写完
+    import writebehind
+
+    writebehind.drain_all()
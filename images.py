@@ -0,0 +1,246 @@
+"""响应式图片：启动时用 Pillow 为 static/ 里的大图生成多种宽度的 WebP / JPEG。
+
+生成结果放在 ``static/build/``，清单 ``static/build/manifest.json`` 记录每张原图的
+sha256；原图没变就不会重新生成。模板里用 ``responsive_img()`` 输出带
+``srcset`` / ``sizes`` / ``loading="lazy"`` 的 ``<picture>``；CSS 背景图用
+``background_css()`` 按屏幕宽度输出 ``image-set()``（WebP 优先，JPEG 兜底）。
+
+gunicorn master 启动时先调用一次 ``load()``（gunicorn.conf.py），worker fork
+之后直接沿用清单，不再各自检查、等锁。也可以手动执行：``python images.py``
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+
+from flask import url_for
+from markupsafe import Markup, escape
+
+try:
+    from PIL import Image
+except ImportError:  # 没装 Pillow 时模板照常输出原图
+    Image = None
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发
+    fcntl = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+BUILD_DIR = os.path.join(STATIC_DIR, "build")
+MANIFEST_PATH = os.path.join(BUILD_DIR, "manifest.json")
+
+WIDTHS = (480, 960, 1440)
+MIN_BYTES = 100 * 1024  # 小于这个大小的图（logo、图标）不值得处理
+EXTENSIONS = (".png", ".jpg", ".jpeg")
+QUALITY = {"webp": 78, "jpg": 80}
+
+logger = logging.getLogger(__name__)
+
+_manifest = {}
+_loaded = False
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _sources():
+    for name in sorted(os.listdir(STATIC_DIR)):
+        path = os.path.join(STATIC_DIR, name)
+        if name.lower().endswith(EXTENSIONS) and os.path.isfile(path) and os.path.getsize(path) >= MIN_BYTES:
+            yield name, path
+
+
+def _save_atomic(img, path, fmt, quality):
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    if fmt == "webp":
+        img.save(tmp, "WEBP", quality=quality, method=4)
+    else:
+        img.save(tmp, "JPEG", quality=quality, optimize=True, progressive=True)
+    os.replace(tmp, path)
+
+
+def _build_one(name, path, digest):
+    stem = os.path.splitext(name)[0]
+    with Image.open(path) as src:
+        src.load()
+        if src.mode in ("RGBA", "LA", "P"):
+            # JPEG 没有透明通道，铺白底
+            rgba = src.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        else:
+            img = src.convert("RGB")
+    width, height = img.size
+
+    widths = sorted({min(w, width) for w in WIDTHS})
+    entry = {"hash": digest, "width": width, "height": height, "webp": [], "jpg": []}
+    for w in widths:
+        resized = img if w == width else img.resize((w, round(height * w / width)), Image.LANCZOS)
+        for fmt in ("webp", "jpg"):
+            out_name = "%s-%d.%s" % (stem, w, fmt)
+            _save_atomic(resized, os.path.join(BUILD_DIR, out_name), fmt, QUALITY[fmt])
+            entry[fmt].append([w, "build/" + out_name])
+    return entry
+
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build(verbose=False):
+    """生成缺失或过期的图片变体，返回最新清单。"""
+    if Image is None:
+        return _load_manifest()
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    # 多个 gunicorn worker 同时启动时只让一个去生成，其余等它完成后读清单
+    with open(os.path.join(BUILD_DIR, ".lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = _load_manifest()
+        changed = False
+        for name, path in _sources():
+            digest = _sha256(path)
+            if manifest.get(name, {}).get("hash") == digest:
+                continue
+            if verbose:
+                print("building %s" % name)
+            manifest[name] = _build_one(name, path, digest)
+            changed = True
+        if changed:
+            tmp = MANIFEST_PATH + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, MANIFEST_PATH)
+    return manifest
+
+
+def _srcset(variants):
+    return ", ".join("%s %dw" % (url_for("static", filename=path), w) for w, path in variants)
+
+
+def responsive_img(filename, alt="", sizes="100vw", **attrs):
+    """输出 ``<picture>``：WebP + JPEG 两组 srcset，懒加载。
+
+    额外的关键字参数作为 ``<img>`` 属性输出，``class_`` 对应 ``class``。
+    """
+    entry = _manifest.get(filename)
+    img_attrs = {"alt": alt, "loading": "lazy", "decoding": "async"}
+    img_attrs.update({k.rstrip("_"): v for k, v in attrs.items()})
+    if not entry:
+        img_attrs["src"] = url_for("static", filename=filename)
+        return Markup("<img %s>" % _attrs(img_attrs))
+
+    img_attrs.update(
+        src=url_for("static", filename=entry["jpg"][-1][1]),
+        srcset=_srcset(entry["jpg"]),
+        sizes=sizes,
+        width=entry["width"],
+        height=entry["height"],
+    )
+    return Markup(
+        '<picture><source type="image/webp" srcset="%s" sizes="%s"><img %s></picture>'
+        % (escape(_srcset(entry["webp"])), escape(sizes), _attrs(img_attrs))
+    )
+
+
+def image_url(filename, width=WIDTHS[-1], fmt="jpg"):
+    """取不小于 ``width`` 的最小变体的 URL，没有变体时返回原图。"""
+    entry = _manifest.get(filename)
+    if not entry:
+        return url_for("static", filename=filename)
+    return url_for("static", filename=_pick(entry[fmt], width))
+
+
+def _pick(variants, width):
+    return next((p for w, p in variants if w >= width), variants[-1][1])
+
+
+def _image_set(entry, width):
+    # 1x / 2x 各给 WebP 和 JPEG，浏览器按像素密度和支持的格式挑一张
+    options = []
+    for density in (1, 2):
+        for fmt, mime in (("webp", "image/webp"), ("jpg", "image/jpeg")):
+            url = url_for("static", filename=_pick(entry[fmt], width * density))
+            options.append('url("%s") %dx type("%s")' % (url, density, mime))
+    return "image-set(%s)" % ", ".join(options)
+
+
+def background_css(selector, filename, layers=""):
+    """输出 ``selector`` 的 background-image 规则：每个宽度断点一条 ``image-set()``。
+
+    ``layers`` 放在图片前面（如 ``"linear-gradient(...), "``）。第一条是普通的
+    ``url()``，不支持带 type() 的 image-set 的浏览器会忽略后面的规则，继续用它。
+    """
+    entry = _manifest.get(filename)
+    if not entry:
+        return Markup('%s { background-image: %surl("%s"); }' % (selector, layers, url_for("static", filename=filename)))
+    rules = [
+        '%s { background-image: %surl("%s"); }' % (selector, layers, image_url(filename)),
+        "%s { background-image: %s%s; }" % (selector, layers, _image_set(entry, entry["width"])),
+    ]
+    # 从大到小，窄屏的规则写在后面覆盖前面的
+    for width in sorted((w for w, _p in entry["jpg"][:-1]), reverse=True):
+        rules.append(
+            "@media (max-width: %dpx) { %s { background-image: %s%s; } }"
+            % (width, selector, layers, _image_set(entry, width))
+        )
+    return Markup("\n".join(rules))
+
+
+def image_variants(filename):
+    """{"webp": [[宽度, URL], ...], "jpg": [...]}，给需要在脚本里挑图的页面用。"""
+    entry = _manifest.get(filename)
+    if not entry:
+        url = url_for("static", filename=filename)
+        return {"webp": [], "jpg": [[0, url]]}
+    return {fmt: [[w, url_for("static", filename=p)] for w, p in entry[fmt]] for fmt in ("webp", "jpg")}
+
+
+def _attrs(attrs):
+    return " ".join('%s="%s"' % (k, escape(v)) for k, v in attrs.items())
+
+
+def load():
+    """生成缺失的变体并读入清单，每个进程只做一次（fork 出来的 worker 继承 master 的结果）。"""
+    global _manifest, _loaded
+    if _loaded:
+        return _manifest
+    if os.environ.get("BUILD_IMAGES", "1") != "0":
+        try:
+            _manifest = build()
+        except OSError as e:
+            # 只读文件系统（如 Vercel）上生成失败时，沿用已有清单或直接用原图
+            logger.warning("responsive image build skipped: %s", e)
+            _manifest = _load_manifest()
+    else:
+        _manifest = _load_manifest()
+    _loaded = True
+    return _manifest
+
+
+def init_app(app):
+    load()
+    app.jinja_env.globals.update(
+        responsive_img=responsive_img,
+        image_url=image_url,
+        background_css=background_css,
+        image_variants=image_variants,
+    )
+
+
+if __name__ == "__main__":
+    if Image is None:
+        sys.exit("Pillow is not installed")
+    result = build(verbose=True)
+    print("%d images in %s" % (len(result), MANIFEST_PATH))
@@ -0,0 +1,156 @@
+"""管理员实时面板：把计数的变化通过 Server-Sent Events 推给浏览器。
+
+每个进程只有一个轮询线程，每隔 ``LIVE_POLL_MS`` 毫秒读一次计数行（两条很小的
+查询，与打开的面板数量无关），和上一次比较，只把变化的部分作为一个事件
+广播给本进程的所有连接；没有连接时线程退出。
+
+每条 SSE 连接在 gthread worker 里只占一个线程，大部分时间阻塞在条件变量上。
+``LIVE_MAX_STREAMS`` 限制每个进程的并发连接数，超出时返回 503，浏览器稍后重连；
+连接最长保持 ``LIVE_STREAM_SECONDS`` 秒后主动结束，EventSource 会自动重连，
+线程不会被长期占住。
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import counters
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = int(os.environ.get("LIVE_POLL_MS", 1000)) / 1000.0
+MAX_STREAMS = int(os.environ.get("LIVE_MAX_STREAMS", 4))
+STREAM_SECONDS = int(os.environ.get("LIVE_STREAM_SECONDS", 300))
+KEEPALIVE_SECONDS = 15
+SIGNUP_MINUTES = 30
+HISTORY = 64  # 保留最近的增量，慢一步的连接可以补齐，太慢则重新发完整快照
+
+
+def _read_state():
+    with db.get_database().connection() as conn:
+        state = dict(counters.read(conn))
+        for minute, count in counters.signups(SIGNUP_MINUTES, conn).items():
+            state["signups:%d" % minute] = count
+    return state
+
+
+def _diff(old, new):
+    return {key: value for key, value in new.items() if old.get(key) != value}
+
+
+class Broadcaster:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._state = {}
+        self._seq = 0
+        self._history = deque(maxlen=HISTORY)
+        self._listeners = 0
+        self._thread = None
+        self._pid = None
+
+    def _ensure_poller(self):
+        # 与 write-behind 相同：fork 之后线程不会被继承，按 pid 判断
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = None
+            self._listeners = 0
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="live-poller", daemon=True)
+            self._thread.start()
+
+    def try_subscribe(self):
+        """占一个连接名额，已满时返回 False。"""
+        with self._cond:
+            if self._pid == os.getpid() and self._listeners >= MAX_STREAMS:
+                return False
+            self._ensure_poller()
+            self._listeners += 1
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self._listeners -= 1
+
+    def listeners(self):
+        with self._cond:
+            return self._listeners if self._pid == os.getpid() else 0
+
+    def snapshot(self, timeout=5):
+        """当前完整状态和序号；刚启动时等待第一次轮询完成。"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > 0, timeout)
+            return self._seq, dict(self._state)
+
+    def changes_since(self, seq, timeout):
+        """等待新的变化，返回 (新序号, 数据, 是否完整快照)。
+
+        超时没有变化时数据为 None；``seq`` 已经滑出历史时返回完整快照。
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != seq, timeout)
+            if self._seq == seq:
+                return seq, None, False
+            if not self._history or self._history[0][0] > seq + 1:
+                return self._seq, dict(self._state), True
+            merged = {}
+            for number, delta in self._history:
+                if number > seq:
+                    merged.update(delta)
+            return self._seq, merged, False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._listeners <= 0:
+                    self._thread = None
+                    return
+            try:
+                state = _read_state()
+            except Exception:
+                logger.exception("live dashboard poll failed")
+                time.sleep(POLL_INTERVAL)
+                continue
+            with self._cond:
+                # 滑出窗口的分钟不会出现在增量里，浏览器端自己丢弃
+                delta = _diff(self._state, state)
+                if delta or self._seq == 0:
+                    self._state = state
+                    self._seq += 1
+                    self._history.append((self._seq, delta))
+                    self._cond.notify_all()
+            time.sleep(POLL_INTERVAL)
+
+
+broadcaster = Broadcaster()
+
+
+def _event(name, seq, data):
+    return "event: %s\nid: %d\ndata: %s\n\n" % (name, seq, json.dumps(data, separators=(",", ":")))
+
+
+def stream():
+    """SSE 生成器：先发完整快照，之后只发增量。
+
+    调用前须 try_subscribe() 成功，响应关闭时（response.call_on_close）unsubscribe()。
+    """
+    yield "retry: 3000\n\n"
+    seq, state = broadcaster.snapshot()
+    yield _event("snapshot", seq, state)
+    deadline = time.monotonic() + STREAM_SECONDS
+    while time.monotonic() < deadline:
+        seq, data, full = broadcaster.changes_since(seq, min(KEEPALIVE_SECONDS, deadline - time.monotonic()))
+        if data is None:
+            yield ": keepalive\n\n"
+        else:
+            yield _event("snapshot" if full else "delta", seq, data)
+
+
+def _collect():
+    return [("live_streams", {}, broadcaster.listeners())]
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,292 @@
+"""请求 / 查询指标，以 Prometheus 文本格式输出。
+
+每个进程在内存里累计计数器和直方图，并定期（最多每秒一次）把快照写到
+``METRICS_DIR/<pid>.json``；``/metrics`` 读取目录里所有 worker 的快照合并后输出，
+所以多个 gunicorn worker 的数据能汇总在一起。已退出的 worker 的计数器保留，
+瞬时值（gauge）只统计仍在运行的进程。
+
+数据库游标由 db.py 包装，每条查询按“语句形状”（去掉字面量后的 SQL）计时计数，
+超过 ``SLOW_QUERY_MS`` 的查询写入慢查询日志。
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from functools import lru_cache
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("slow_query")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+METRICS_DIR = os.environ.get("METRICS_DIR") or os.path.join(
+    tempfile.gettempdir(), "recruitment-metrics-" + hashlib.sha1(BASE_DIR.encode()).hexdigest()[:8]
+)
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_MS", 200)) / 1000.0
+FLUSH_INTERVAL = 1.0
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+HELP = {
+    "http_requests_total": ("counter", "HTTP requests by route, method and status."),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by route."),
+    "db_queries_total": ("counter", "Database statements by statement shape."),
+    "db_query_duration_seconds": ("histogram", "Database statement latency by statement shape."),
+    "db_slow_queries_total": ("counter", "Statements slower than SLOW_QUERY_MS."),
+    "db_pool_wait_seconds": ("histogram", "Time spent waiting for a pooled connection."),
+    "db_pool_timeouts_total": ("counter", "Connection checkouts that gave up waiting."),
+    "writebehind_flushes_total": ("counter", "Write-behind batches committed."),
+    "writebehind_flushed_items_total": ("counter", "Items committed by write-behind flushes."),
+    "writebehind_errors_total": ("counter", "Write-behind flushes that failed and were re-queued."),
+    "writebehind_flush_seconds": ("histogram", "Write-behind flush transaction latency."),
+    "writebehind_pending": ("gauge", "Items waiting in write-behind queues (live workers)."),
+    "writebehind_inflight": ("gauge", "Items in the batch currently being flushed (live workers)."),
+    "live_streams": ("gauge", "Open admin dashboard SSE connections (live workers)."),
+    "password_hash_seconds": ("histogram", "Password hash/verify latency including time queued in the pool."),
+    "password_hash_rejected_total": ("counter", "Password hash/verify calls rejected because the pool was full."),
+    "password_hash_busy": ("gauge", "Password hash/verify calls running or queued (live workers)."),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_collectors = []
+_last_flush = 0.0
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, labels, amount=1):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, labels, value, buckets):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"buckets": list(buckets), "counts": [0] * (len(buckets) + 1), "sum": 0.0}
+        for i, bound in enumerate(hist["buckets"]):
+            if value <= bound:
+                hist["counts"][i] += 1
+                break
+        else:
+            hist["counts"][-1] += 1
+        hist["sum"] += value
+
+
+def register_collector(fn):
+    """fn() 返回 [(name, labels, value), ...]，作为 gauge 输出（如 write-behind 队列深度）。"""
+    _collectors.append(fn)
+
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(sql):
+    """把 SQL 归一成“形状”：去掉字面量、折叠 IN 列表和空白，作为指标标签。"""
+    shape = _SPACE_RE.sub(" ", sql).strip()
+    shape = shape.replace("%s", "?")
+    shape = _LITERAL_RE.sub("?", shape)
+    shape = _IN_LIST_RE.sub("(...)", shape)
+    return shape[:200]
+
+
+def observe_query(sql, seconds):
+    shape = statement_shape(sql)
+    inc("db_queries_total", {"statement": shape})
+    observe("db_query_duration_seconds", {"statement": shape}, seconds, QUERY_BUCKETS)
+    if seconds >= SLOW_QUERY_SECONDS:
+        inc("db_slow_queries_total", {"statement": shape})
+        slow_query_logger.warning("slow query %.1fms: %s", seconds * 1000, shape)
+
+
+def observe_pool_wait(seconds):
+    observe("db_pool_wait_seconds", {}, seconds, QUERY_BUCKETS)
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        elapsed = time.perf_counter() - start
+        inc("http_requests_total", {"route": route, "method": request.method, "status": str(response.status_code)})
+        observe("http_request_duration_seconds", {"route": route}, elapsed, REQUEST_BUCKETS)
+    maybe_flush()
+    return response
+
+
+def _snapshot():
+    with _lock:
+        counters = [[name, dict(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [[name, dict(labels), dict(hist, counts=list(hist["counts"]))] for (name, labels), hist in _histograms.items()]
+    gauges = []
+    for fn in _collectors:
+        try:
+            gauges.extend([name, labels, value] for name, labels, value in fn())
+        except Exception:
+            logger.exception("metrics collector failed")
+    return {"pid": os.getpid(), "counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+def _reset_after_fork():
+    # fork 出来的 worker 不继承父进程的计数，否则合并各进程快照时会重复计算
+    global _lock, _counters, _histograms, _last_flush
+    _lock = threading.Lock()
+    _counters, _histograms = {}, {}
+    _last_flush = 0.0
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def flush():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, "%d.json" % os.getpid())
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+
+def maybe_flush():
+    global _last_flush
+    now = time.monotonic()
+    if now - _last_flush >= FLUSH_INTERVAL:
+        _last_flush = now
+        try:
+            flush()
+        except OSError as e:
+            logger.warning("could not write metrics snapshot: %s", e)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _merge():
+    counters = {}
+    histograms = {}
+    gauges = {}
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        names = []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, labels, value in snap["counters"]:
+            key = _key(metric, labels)
+            counters[key] = counters.get(key, 0) + value
+        for metric, labels, hist in snap["histograms"]:
+            key = _key(metric, labels)
+            merged = histograms.get(key)
+            if merged is None or merged["buckets"] != hist["buckets"]:
+                histograms[key] = dict(hist, counts=list(hist["counts"]))
+            else:
+                merged["counts"] = [a + b for a, b in zip(merged["counts"], hist["counts"])]
+                merged["sum"] += hist["sum"]
+        if _pid_alive(snap["pid"]):
+            for metric, labels, value in snap["gauges"]:
+                key = _key(metric, labels)
+                gauges[key] = gauges.get(key, 0) + value
+    return counters, histograms, gauges
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join('%s="%s"' % (k, _escape(v)) for k, v in items) + "}"
+
+
+def render():
+    """合并所有进程的快照，输出 Prometheus 文本格式。"""
+    flush()
+    counters, histograms, gauges = _merge()
+    lines = []
+    seen = set()
+
+    def header(name, default_type):
+        if name not in seen:
+            seen.add(name)
+            kind, text = HELP.get(name, (default_type, name))
+            lines.append("# HELP %s %s" % (name, text))
+            lines.append("# TYPE %s %s" % (name, kind))
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter")
+        lines.append("%s%s %s" % (name, _labels(labels), value))
+    for (name, labels), hist in sorted(histograms.items()):
+        header(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(hist["buckets"], hist["counts"]):
+            cumulative += count
+            lines.append("%s_bucket%s %d" % (name, _labels(labels, [("le", repr(float(bound)))]), cumulative))
+        cumulative += hist["counts"][-1]
+        lines.append("%s_bucket%s %d" % (name, _labels(labels, [("le", "+Inf")]), cumulative))
+        lines.append("%s_sum%s %s" % (name, _labels(labels), hist["sum"]))
+        lines.append("%s_count%s %d" % (name, _labels(labels), cumulative))
+    for (name, labels), value in sorted(gauges.items()):
+        header(name, "gauge")
+        lines.append("%s%s %s" % (name, _labels(labels), value))
+    return "\n".join(lines) + "\n"
+
+
+def clear():
+    """删除旧快照（gunicorn master 启动时调用）。"""
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return
+    for name in names:
+        try:
+            os.remove(os.path.join(METRICS_DIR, name))
+        except OSError:
+            pass
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except OSError:
+        pass
@@ -0,0 +1,251 @@
+"""按版本号执行的数据库迁移。
+
+``schema_version`` 表记录已执行到的版本。启动时 ``run()`` 只查一次最大版本号，
+已是最新就直接返回；否则在锁内（PostgreSQL 用 advisory lock，SQLite 用数据库
+文件旁的锁文件）按顺序执行尚未执行的步骤，每步完成后立即记录版本号。
+
+数据量大的步骤分批复制、每批提交，只持有很短的写锁；中途被中断（部署超时、
+worker 被杀）时，下次启动会从上次的位置继续。
+
+gunicorn 的 master 在 fork worker 之前执行一次（gunicorn.conf.py），App 导入时
+的调用因此只剩一次版本查询；也可以手动执行：``python migrations.py``
+"""
+import logging
+import os
+import sys
+
+import activities
+import counters
+import db
+import stamps
+import users
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", 5000))
+ADVISORY_LOCK_KEY = 727_001  # 本应用专用的 pg_advisory_lock 键
+
+USER_COLUMNS = ["id", "name", "email", "phone", "password", "stamps"]
+
+
+def _create_users(conn):
+    cur = conn.cursor()
+    if db.is_postgres():
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL,
+                email TEXT UNIQUE,
+                phone TEXT,
+                password TEXT NOT NULL,
+                stamps TEXT DEFAULT ''
+            )
+            """
+        )
+    else:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                email TEXT UNIQUE,
+                phone TEXT,
+                password TEXT NOT NULL,
+                stamps TEXT DEFAULT ''
+            )
+            """
+        )
+
+
+def _drop_legacy_user_columns(conn):
+    """旧版 SQLite 的 users 带有 gender / age 等列；SQLite 不能 DROP COLUMN，重建表。
+
+    数据按 id 分批复制到 users_new，每批提交；中断后按 users_new 里已有的最大 id 续传。
+    """
+    if db.is_postgres():
+        return
+    existing = [row["name"] for row in db.query_all("PRAGMA table_info(users)", conn=conn)]
+    if set(existing) == set(USER_COLUMNS):
+        return
+
+    select_cols = []
+    for col in USER_COLUMNS:
+        if col in existing:
+            select_cols.append(col)
+        elif col == "id":
+            select_cols.append("rowid")
+        else:
+            select_cols.append("''")
+    id_expr = select_cols[0]
+
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS users_new (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+        "email TEXT UNIQUE, phone TEXT, password TEXT NOT NULL, stamps TEXT DEFAULT '')",
+        conn=conn,
+    )
+    conn.commit()
+    last_id = db.query_one("SELECT COALESCE(MAX(id), 0) AS n FROM users_new", conn=conn)["n"]
+    while True:
+        cur = db.execute(
+            "INSERT INTO users_new (id, name, email, phone, password, stamps) SELECT %s FROM users "
+            "WHERE %s > ? ORDER BY %s LIMIT ?" % (", ".join(select_cols), id_expr, id_expr),
+            (last_id, BATCH_SIZE),
+            conn=conn,
+        )
+        copied = cur.rowcount
+        last_id = db.query_one("SELECT COALESCE(MAX(id), 0) AS n FROM users_new", conn=conn)["n"]
+        conn.commit()
+        logger.info("copied %d users into users_new (up to id %d)", copied, last_id)
+        if copied < BATCH_SIZE:
+            break
+
+    # 重建 users 时先关闭外键，否则 DROP TABLE 会连带删除 user_stamps
+    conn.execute("PRAGMA foreign_keys=OFF")
+    try:
+        db.execute("DROP TABLE users", conn=conn)
+        db.execute("ALTER TABLE users_new RENAME TO users", conn=conn)
+        conn.commit()
+    finally:
+        conn.execute("PRAGMA foreign_keys=ON")
+
+
+def _create_user_stamps(conn):
+    stamps.create_table(conn.cursor())
+
+
+def _migrate_csv_stamps(conn):
+    # 旧的 users.stamps 逗号字符串迁移到 user_stamps，分批提交，已迁移的行会被清空，天然可续传
+    stamps.migrate_csv_stamps(conn, BATCH_SIZE)
+
+
+def _create_user_indexes(conn):
+    users.create_indexes(conn)
+
+
+def _enforce_unique_accounts(conn):
+    # 第 5 步早先遇到大小写重复时只建了普通索引也记为完成，这里补建唯一索引；仍有重复则报错停止
+    users.create_indexes(conn)
+
+
+def _create_counter_deltas(conn):
+    # PostgreSQL 的计数触发器改为追加增量行，不再更新共享的计数行
+    counters.create_tables(conn)
+    counters.create_triggers(conn)
+
+
+def _create_activities(conn):
+    # 库里原有一张没用上的 activities 表，补齐列，空表时写入原来页面上的内容
+    activities.create_table(conn)
+    activities.seed(conn)
+
+
+def _create_event_counters(conn):
+    # 建表、装触发器、按现有数据算初值在同一个事务里完成，期间的写入不会漏计
+    counters.create_tables(conn)
+    counters.create_triggers(conn)
+    counters.rebuild(conn)
+
+
+# (版本号, 名称, 函数)。只能在末尾追加，不要修改或重排已发布的步骤。
+MIGRATIONS = [
+    (1, "create users", _create_users),
+    (2, "drop legacy user columns", _drop_legacy_user_columns),
+    (3, "create user_stamps", _create_user_stamps),
+    (4, "migrate csv stamps", _migrate_csv_stamps),
+    (5, "user lookup indexes", _create_user_indexes),
+    (6, "activity catalog", _create_activities),
+    (7, "event counters", _create_event_counters),
+    (8, "enforce unique user accounts", _enforce_unique_accounts),
+    (9, "event counter deltas", _create_counter_deltas),
+    (10, "signup deltas", _create_counter_deltas),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+_checked = None  # 本进程已确认是最新版本的 Database 对象（db.configure 切换后会重新检查）
+
+
+def current_version(conn):
+    try:
+        row = db.query_one("SELECT MAX(version) AS v FROM schema_version", conn=conn)
+    except db.DatabaseError:
+        # 表还不存在（全新数据库或第一次引入版本管理）
+        conn.rollback()
+        return 0
+    return row["v"] or 0
+
+
+def _ensure_version_table(conn):
+    if db.is_postgres():
+        ts = "TIMESTAMPTZ NOT NULL DEFAULT now()"
+    else:
+        ts = "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at %s)" % ts,
+        conn=conn,
+    )
+    conn.commit()
+
+
+class _MigrationLock:
+    """同一时间只允许一个进程执行迁移。"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._file = None
+
+    def __enter__(self):
+        if db.is_postgres():
+            db.execute("SELECT pg_advisory_lock(?)", (ADVISORY_LOCK_KEY,), conn=self.conn)
+            self.conn.commit()
+        else:
+            self._file = open(db.get_database().sqlite_path + ".migrate.lock", "w")
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if db.is_postgres():
+            self.conn.rollback()
+            db.execute("SELECT pg_advisory_unlock(?)", (ADVISORY_LOCK_KEY,), conn=self.conn)
+            self.conn.commit()
+        else:
+            self._file.close()
+
+
+def run():
+    """把数据库迁移到最新版本，返回执行的步骤数。已是最新时只有一次版本查询。"""
+    global _checked
+    database = db.get_database()
+    if _checked is database:
+        return 0
+    applied = 0
+    with database.connection() as conn:
+        if current_version(conn) < LATEST:
+            with _MigrationLock(conn):
+                _ensure_version_table(conn)
+                # 拿到锁后再查一次，可能别的进程刚刚迁移完
+                version = current_version(conn)
+                for number, name, step in MIGRATIONS:
+                    if number <= version:
+                        continue
+                    logger.info("applying migration %d: %s", number, name)
+                    step(conn)
+                    db.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (number, name), conn=conn)
+                    conn.commit()
+                    applied += 1
+    _checked = database
+    return applied
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    count = run()
+    print("applied %d migration(s), schema is at version %d" % (count, LATEST))
+    sys.exit(0)
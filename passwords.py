@@ -0,0 +1,124 @@
+"""密码哈希：werkzeug 的加盐 scrypt / pbkdf2，成本参数可配置。
+
+哈希是 CPU（scrypt 还占内存）密集型操作，登录高峰时如果每个请求线程都直接算，
+所有请求会一起变慢。这里把哈希放进每个进程一个的有界线程池：
+``PASSWORD_HASH_WORKERS`` 个线程同时计算（hashlib 计算时释放 GIL），最多再排队
+``PASSWORD_HASH_QUEUE`` 个；再多就立即抛 ``Overloaded``，页面提示稍后再试，
+已经在排队的请求不受影响。
+
+计算和排队的请求各占一个 gunicorn 线程，所以两者之和必须小于
+``GUNICORN_THREADS``，否则线程先被占满，新请求在 gunicorn 里等待，永远不会
+触发 ``Overloaded``。默认排队数按线程数推算：哈希最多占一半线程
+（8 个线程、2 个计算时排队 2 个），剩下的线程照常处理其他页面。
+
+旧数据里的明文密码在下一次登录成功时换成哈希；修改 ``PASSWORD_HASH_METHOD``
+后，旧参数的哈希也会在登录时按新参数重算。
+"""
+import hmac
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import metrics
+
+METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+SALT_LENGTH = int(os.environ.get("PASSWORD_SALT_LENGTH", 16))
+WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE") or max(0, int(os.environ.get("GUNICORN_THREADS", 8)) // 2 - WORKERS))
+
+_HASH_RE = re.compile(r"^(scrypt:\d+:\d+:\d+|pbkdf2:[a-z0-9_]+:\d+)\$[^$]+\$[0-9a-f]+$")
+
+
+class Overloaded(RuntimeError):
+    """哈希线程池和队列都已满。"""
+
+
+def is_hash(stored):
+    return bool(stored) and _HASH_RE.match(stored) is not None
+
+
+def hash_sync(password, method=None):
+    """在当前线程计算哈希（命令行批量导入用）。"""
+    return generate_password_hash(password, method=method or METHOD, salt_length=SALT_LENGTH)
+
+
+class HashPool:
+    def __init__(self, workers, queue):
+        self.workers = workers
+        self.queue = queue
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._busy = 0
+
+    def _ensure(self):
+        # gunicorn fork 之后线程池不能沿用父进程的
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            self._slots = threading.BoundedSemaphore(self.workers + self.queue)
+            self._busy = 0
+
+    def run(self, op, fn, *args):
+        with self._lock:
+            self._ensure()
+            slots = self._slots
+            executor = self._executor
+        if not slots.acquire(blocking=False):
+            metrics.inc("password_hash_rejected_total", {"op": op})
+            raise Overloaded("password hashing is overloaded")
+        with self._lock:
+            self._busy += 1
+        start = time.perf_counter()
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._busy -= 1
+            slots.release()
+            metrics.observe("password_hash_seconds", {"op": op}, time.perf_counter() - start, metrics.REQUEST_BUCKETS)
+
+    def busy(self):
+        with self._lock:
+            return self._busy if self._pid == os.getpid() else 0
+
+
+pool = HashPool(WORKERS, QUEUE)
+
+
+def hash_password(password):
+    """计算新哈希；线程池满时抛 Overloaded。"""
+    return pool.run("hash", hash_sync, password)
+
+
+@lru_cache(maxsize=1)
+def _method_prefix():
+    # "scrypt" / "pbkdf2:sha256" 这类省略参数的写法由 werkzeug 补全，以它实际写出的前缀为准
+    return hash_sync("").split("$", 1)[0] + "$"
+
+
+def needs_rehash(stored):
+    return not is_hash(stored) or not stored.startswith(_method_prefix())
+
+
+def verify(stored, password):
+    """校验密码，返回 (是否正确, 是否需要重新哈希)。线程池满时抛 Overloaded。"""
+    if not is_hash(stored):
+        # 旧的明文密码：比较不耗 CPU，不进线程池
+        ok = hmac.compare_digest((stored or "").encode(), password.encode())
+        return ok, ok
+    ok = pool.run("verify", check_password_hash, stored, password)
+    return ok, ok and needs_rehash(stored)
+
+
+def _collect():
+    return [("password_hash_busy", {}, pool.busy())]
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,154 @@
+"""印章存储：每个用户每个印章一行 ``user_stamps(user_id, stamp_idx, awarded_at)``。
+
+主键 (user_id, stamp_idx) 保证同一印章只记一次，发章是一条
+``INSERT ... ON CONFLICT DO NOTHING``，不需要先读再写，多个标签页或扫码枪
+同时提交也不会互相覆盖。
+
+设置 ``STAMP_WRITE_BEHIND=1`` 后，请求路径上的发章先进入 write-behind 队列，由后台
+线程按 ``STAMP_FLUSH_MS`` 毫秒或 ``STAMP_FLUSH_MAX`` 条成批提交。
+
+队列只在入队的那个 gunicorn worker 里。用户自己领的印章（``/estamp/<idx>``、扫摊位码）
+同时记在 session 里，``/estamp`` 无论落到哪个 worker 都会合并进来，确认落库后再从
+session 删除。仍有两种情况在落库前看不到：
+
+- 工作人员扫码枪（``/checkin/scan``）代发的印章，请求不带参会者的 session，要等
+  入队 worker 的下一次提交（通常 ``STAMP_FLUSH_MS`` 毫秒内）；
+- 入队的 worker 在写入前被强制杀掉（正常退出会先 drain），session 里的记录会一直
+  显示，但数据库里没有，需要用户重新领取。
+"""
+import os
+
+import db
+from writebehind import WriteBehindQueue
+
+STAMP_COUNT = 4
+
+# 参数顺序为 (stamp_idx, user_id)；用 SELECT 带出用户，已删除的用户直接跳过，
+# 不会因外键错误让整批写入失败
+AWARD_SQL = """
+    INSERT INTO user_stamps (user_id, stamp_idx)
+    SELECT id, ? FROM users WHERE id = ?
+    ON CONFLICT (user_id, stamp_idx) DO NOTHING
+"""
+
+
+def create_table(cur):
+    if db.is_postgres():
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_stamps (
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                stamp_idx SMALLINT NOT NULL,
+                awarded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (user_id, stamp_idx)
+            )
+            """
+        )
+    else:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_stamps (
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                stamp_idx INTEGER NOT NULL,
+                awarded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, stamp_idx)
+            ) WITHOUT ROWID
+            """
+        )
+
+
+def migrate_csv_stamps(conn, batch_size=5000):
+    """把旧的 ``users.stamps`` 逗号字符串搬进 user_stamps，搬完后清空旧列。
+
+    按 id 分批，每批单独提交；中断后再执行只会处理尚未清空的行。
+    """
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.query_all(
+            "SELECT id, stamps FROM users WHERE id > ? AND stamps IS NOT NULL AND stamps <> '' ORDER BY id LIMIT ?",
+            (last_id, batch_size),
+            conn=conn,
+        )
+        if not rows:
+            break
+        pairs = []
+        for row in rows:
+            for part in row["stamps"].split(","):
+                part = part.strip()
+                if part.isdigit() and int(part) < STAMP_COUNT:
+                    pairs.append((row["id"], int(part)))
+        award_many(pairs, conn=conn)
+        db.executemany("UPDATE users SET stamps = '' WHERE id = ?", [(row["id"],) for row in rows], conn=conn)
+        conn.commit()
+        total += len(pairs)
+        last_id = rows[-1]["id"]
+    return total
+
+
+def is_valid(idx):
+    return 0 <= idx < STAMP_COUNT
+
+
+def get_stamps(user_id, conn=None):
+    rows = db.query_all(
+        "SELECT stamp_idx FROM user_stamps WHERE user_id = ? ORDER BY stamp_idx", (user_id,), conn=conn
+    )
+    return [row["stamp_idx"] for row in rows]
+
+
+def award(user_id, idx, conn=None):
+    """发一个印章，返回是否为新发放。调用方负责 commit。"""
+    cur = db.execute(AWARD_SQL, (idx, user_id), conn=conn)
+    return cur.rowcount == 1
+
+
+def award_many(pairs, conn=None):
+    """批量发章，``pairs`` 为 (user_id, stamp_idx)。调用方负责 commit。
+
+    按用户排序写入：计数触发器逐条锁住用户行，所有批次按同一顺序加锁才不会互相死锁。
+    """
+    params = [(idx, user_id) for user_id, idx in sorted(pairs)]
+    if params:
+        db.executemany(AWARD_SQL, params, conn=conn)
+    return len(params)
+
+
+def _flush(pairs):
+    with db.get_database().connection() as conn:
+        award_many(pairs, conn=conn)
+        conn.commit()
+
+
+writer = None
+if os.environ.get("STAMP_WRITE_BEHIND") == "1":
+    writer = WriteBehindQueue(
+        "stamps",
+        _flush,
+        interval=int(os.environ.get("STAMP_FLUSH_MS", 50)) / 1000.0,
+        max_batch=int(os.environ.get("STAMP_FLUSH_MAX", 500)),
+    )
+
+
+def record(user_id, idx):
+    """请求路径上的发章。
+
+    开启 write-behind 时只入队并返回 None；队列满或未开启时直接写，返回是否为新发放。
+    同步写的情况由调用方负责 commit。
+    """
+    if writer is not None and writer.submit(user_id, idx):
+        return None
+    return award(user_id, idx)
+
+
+def collected(user_id, queued=()):
+    """已落库的印章加上尚未写入的印章。
+
+    ``queued`` 是调用方记在用户 session 里的排队印章：write-behind 队列只在本进程内，
+    请求落到别的 gunicorn worker 时靠它补齐。返回 (全部印章, 已经落库的 queued 部分)。
+    """
+    stored = set(get_stamps(user_id))
+    result = stored | {idx for idx in queued if is_valid(idx)}
+    if writer is not None:
+        result |= writer.pending_for(user_id)
+    return sorted(result), stored & set(queued)
@@ -0,0 +1,189 @@
+"""用户表的查询：登录查找、注册，以及管理后台分页 / 搜索 / 导出。"""
+import counters
+import db
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def create_indexes(conn):
+    # 姓名、邮箱按小写唯一：登录查找是索引点查，注册和批量导入都只靠唯一约束判重
+    if db.is_postgres():
+        # text_pattern_ops 让 LIKE 'abc%' 前缀查询在任何排序规则下都能走索引，等值查询同样可用
+        _create_unique_index(conn, "name", "ux_users_name_lower", "ix_users_name_prefix", "lower(name) text_pattern_ops")
+        _create_unique_index(conn, "email", "ux_users_email_lower", "ix_users_email_prefix", "lower(email) text_pattern_ops")
+    else:
+        _create_unique_index(conn, "name", "ux_users_name_lower", "ix_users_name_prefix", "lower(name)")
+        _create_unique_index(conn, "email", "ux_users_email_lower", "ix_users_email_prefix", "lower(email)")
+    db.execute("CREATE INDEX IF NOT EXISTS ix_user_stamps_stamp ON user_stamps (stamp_idx)", conn=conn)
+
+
+def duplicate_accounts(column, conn=None, limit=20):
+    """按小写重复的姓名 / 邮箱 [(值, [id, ...]), ...]，最多 ``limit`` 组。"""
+    rows = db.query_all(
+        """
+        SELECT lower(%(col)s) AS value, COUNT(*) AS n FROM users WHERE %(col)s IS NOT NULL
+        GROUP BY lower(%(col)s) HAVING COUNT(*) > 1 ORDER BY lower(%(col)s) LIMIT ?
+        """ % {"col": column},
+        (limit,),
+        conn=conn,
+    )
+    result = []
+    for row in rows:
+        ids = db.query_all(
+            "SELECT id FROM users WHERE lower(%s) = ? ORDER BY id" % column, (row["value"],), conn=conn
+        )
+        result.append((row["value"], [r["id"] for r in ids]))
+    return result
+
+
+def _create_unique_index(conn, column, unique_name, legacy_name, expr):
+    """建唯一索引。已有仅大小写不同的重复数据时直接报错，迁移不会记为完成。
+
+    之前的版本在这种情况下退回普通索引（``legacy_name``），注册就不再判重；
+    现在要求先在数据库里合并或改名重复的账号，再重新部署。
+    """
+    duplicates = duplicate_accounts(column, conn)
+    if duplicates:
+        raise RuntimeError(
+            "users.%s has values that differ only by case; rename or merge these accounts and redeploy: %s"
+            % (column, "; ".join("%s (ids %s)" % (value, ", ".join(map(str, ids))) for value, ids in duplicates))
+        )
+    db.execute("CREATE UNIQUE INDEX IF NOT EXISTS %s ON users (%s)" % (unique_name, expr), conn=conn)
+    db.execute("DROP INDEX IF EXISTS %s" % legacy_name, conn=conn)
+
+
+def _account_columns(account):
+    # 只有含 @ 的输入才可能是邮箱；先查邮箱，查不到再按姓名查
+    return ("email", "name") if "@" in account else ("name",)
+
+
+def find_by_account(account):
+    """按姓名或邮箱（不区分大小写）查找用户，每次都是一次索引点查。"""
+    for column in _account_columns(account):
+        user = db.query_one("SELECT * FROM users WHERE lower(%s) = lower(?)" % column, (account,))
+        if user:
+            return user
+    return None
+
+
+def set_password(account, password):
+    """按姓名或邮箱更新密码，返回更新的行数。调用方负责 commit。"""
+    for column in _account_columns(account):
+        cur = db.execute("UPDATE users SET password = ? WHERE lower(%s) = lower(?)" % column, (password, account))
+        if cur.rowcount:
+            return cur.rowcount
+    return 0
+
+
+def upgrade_password(user_id, old_password, new_password):
+    """登录时把明文或旧参数的哈希换成新哈希。
+
+    只在密码仍是 ``old_password`` 时更新，不会覆盖同时发生的重置。调用方负责 commit。
+    """
+    cur = db.execute(
+        "UPDATE users SET password = ? WHERE id = ? AND password = ?", (new_password, user_id, old_password)
+    )
+    return cur.rowcount == 1
+
+
+def create(name, email, phone, password):
+    """单条 INSERT 注册，重名 / 重复邮箱由唯一索引拒绝。
+
+    返回 None 表示成功，否则返回冲突的字段 "name" 或 "email"。调用方负责 commit。
+    """
+    try:
+        db.execute(
+            """
+            INSERT INTO users (name, email, phone, password)
+            VALUES (?, ?, ?, ?)
+            """,
+            (name, email, phone, password),
+        )
+    except db.IntegrityError as e:
+        db.rollback()
+        return _violated_column(e)
+    return None
+
+
+def _violated_column(exc):
+    diag = getattr(exc, "diag", None)
+    constraint = getattr(diag, "constraint_name", None) or str(exc)
+    # SQLite: "UNIQUE constraint failed: index 'ux_users_name_lower'" / "users.email"
+    # PostgreSQL: ux_users_name_lower / users_email_key
+    if "name" in constraint and "email" not in constraint:
+        return "name"
+    return "email"
+
+
+def _prefix_condition(column, prefix):
+    """返回 (SQL 片段, 参数)，按前缀匹配 lower(column) 且能用上索引。"""
+    if db.is_postgres():
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return "lower(%s) LIKE ? ESCAPE '\\'" % column, [escaped + "%"]
+    # SQLite 的 LIKE 不能对表达式索引做优化，改用等价的区间查询
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return "(lower(%s) >= ? AND lower(%s) < ?)" % (column, column), [prefix, upper]
+
+
+def search_page(query="", after=0, limit=PAGE_SIZE):
+    """按 id 游标分页（keyset），返回 (本页用户, 下一页游标或 None)。"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    where = ["id > ?"]
+    params = [after]
+    query = query.strip().lower()
+    if query:
+        name_sql, name_params = _prefix_condition("name", query)
+        email_sql, email_params = _prefix_condition("email", query)
+        where.append("(%s OR %s)" % (name_sql, email_sql))
+        params += name_params + email_params
+    rows = db.query_all(
+        "SELECT id, name, email, phone FROM users WHERE " + " AND ".join(where) + " ORDER BY id LIMIT ?",
+        params + [limit + 1],
+    )
+    users = [dict(row) for row in rows[:limit]]
+    next_after = users[-1]["id"] if len(rows) > limit else None
+
+    if users:
+        ids = [user["id"] for user in users]
+        collected = {}
+        for row in db.query_all(
+            "SELECT user_id, stamp_idx FROM user_stamps WHERE user_id IN (%s) ORDER BY user_id, stamp_idx"
+            % ",".join("?" * len(ids)),
+            ids,
+        ):
+            collected.setdefault(row["user_id"], []).append(row["stamp_idx"])
+        for user in users:
+            user["stamps"] = collected.get(user["id"], [])
+    return users, next_after
+
+
+def summary():
+    """总人数、每个印章的完成人数、集满人数；读触发器维护的计数行，不做聚合。"""
+    values = counters.read()
+    return {
+        "total_users": values[counters.USERS_TOTAL],
+        "per_stamp": [values[name] for name in counters.STAMP_NAMES],
+        "full_card": values[counters.FULL_CARD],
+    }
+
+
+def export_rows(batch_size=1000):
+    """逐个产出 (id, name, email, phone, [stamps])，结果集走服务端游标，不整表载入内存。"""
+    current = None
+    for row in db.stream(
+        """
+        SELECT u.id, u.name, u.email, u.phone, s.stamp_idx
+        FROM users u LEFT JOIN user_stamps s ON s.user_id = u.id
+        ORDER BY u.id, s.stamp_idx
+        """,
+        batch_size=batch_size,
+    ):
+        if current is None or current["id"] != row["id"]:
+            if current is not None:
+                yield current
+            current = {"id": row["id"], "name": row["name"], "email": row["email"], "phone": row["phone"], "stamps": []}
+        if row["stamp_idx"] is not None:
+            current["stamps"].append(row["stamp_idx"])
+    if current is not None:
+        yield current
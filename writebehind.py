@@ -0,0 +1,174 @@
+"""写后合并（write-behind）队列。
+
+请求线程只把 (key, value) 放进进程内队列，同一个 key 的多次写入合并成一个集合；
+后台线程每隔 ``interval`` 秒或攒够 ``max_batch`` 条时，用一个事务一次性写入。
+SQLite 上这样一批只 fsync 一次，也不会让大量请求排队抢写锁。
+
+队列有上限：满了 ``submit()`` 返回 False，调用方改为同步写。进程退出时
+（atexit 或 gunicorn 的 worker_exit 钩子）调用 ``drain_all()`` 把剩余数据写完。
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_queues = []
+
+
+class WriteBehindQueue:
+    def __init__(self, name, flush_fn, interval=0.05, max_batch=500, max_pending=10000):
+        self.name = name
+        self.flush_fn = flush_fn  # flush_fn([(key, value), ...])，在一个事务里写完
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._inflight = {}
+        self._count = 0
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self.flushes = 0
+        self.flushed_items = 0
+        self.errors = 0
+        self.last_flush_seconds = 0.0
+        _queues.append(self)
+
+    def submit(self, key, value):
+        """放入队列，返回 False 表示队列已满，调用方需要自己同步写。"""
+        with self._cond:
+            self._ensure_worker()
+            values = self._pending.setdefault(key, set())
+            if value in values:
+                return True
+            if self._count >= self.max_pending:
+                if not values:
+                    del self._pending[key]
+                return False
+            values.add(value)
+            self._count += 1
+            if self._count >= self.max_batch:
+                self._cond.notify()
+            return True
+
+    def pending_for(self, key):
+        """还没落库的值（包括正在写的那一批），读路径要合并进去。"""
+        with self._cond:
+            return set(self._pending.get(key, ())) | set(self._inflight.get(key, ()))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": self._count,
+                "inflight": sum(len(v) for v in self._inflight.values()),
+                "flushes": self.flushes,
+                "flushed_items": self.flushed_items,
+                "errors": self.errors,
+                "last_flush_seconds": self.last_flush_seconds,
+            }
+
+    def _ensure_worker(self):
+        # gunicorn fork 之后线程不会被继承，按 pid 判断是否需要重新启动
+        if self._thread is None or self._pid != os.getpid():
+            if self._pid != os.getpid():
+                self._pending, self._inflight, self._count = {}, {}, 0
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="writebehind-" + self.name, daemon=True)
+            self._thread.start()
+
+    def _take_batch(self):
+        batch = {}
+        taken = 0
+        for key in list(self._pending):
+            values = self._pending.pop(key)
+            batch[key] = values
+            taken += len(values)
+            if taken >= self.max_batch:
+                break
+        self._count -= taken
+        self._inflight = batch
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.interval
+                while not self._stopping and self._count < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopping and not self._count:
+                    return
+                if not self._count:
+                    continue
+                batch = self._take_batch()
+            self._flush(batch)
+
+    def _flush(self, batch):
+        items = [(key, value) for key, values in batch.items() for value in sorted(values)]
+        start = time.perf_counter()
+        try:
+            self.flush_fn(items)
+        except Exception:
+            logger.exception("write-behind flush of %d %s items failed, will retry", len(items), self.name)
+            metrics.inc("writebehind_errors_total", {"queue": self.name})
+            with self._cond:
+                self.errors += 1
+                # 放回队列等下一轮重试，同时保证读路径仍能看到这些值
+                for key, values in batch.items():
+                    merged = self._pending.setdefault(key, set())
+                    self._count += len(values - merged)
+                    merged |= values
+                self._inflight = {}
+            time.sleep(self.interval)
+            return
+        elapsed = time.perf_counter() - start
+        metrics.inc("writebehind_flushes_total", {"queue": self.name})
+        metrics.inc("writebehind_flushed_items_total", {"queue": self.name}, len(items))
+        metrics.observe("writebehind_flush_seconds", {"queue": self.name}, elapsed, metrics.QUERY_BUCKETS)
+        with self._cond:
+            self._inflight = {}
+            self.flushes += 1
+            self.flushed_items += len(items)
+            self.last_flush_seconds = elapsed
+
+    def drain(self, timeout=10):
+        """停止后台线程，并把剩余数据全部写完。"""
+        with self._cond:
+            thread = self._thread
+            if thread is None or self._pid != os.getpid():
+                return
+            self._stopping = True
+            self._cond.notify()
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("write-behind %s did not drain within %ss", self.name, timeout)
+        self._thread = None
+
+
+def _collect():
+    result = []
+    for queue in _queues:
+        stats = queue.stats()
+        result.append(("writebehind_pending", {"queue": queue.name}, stats["pending"]))
+        result.append(("writebehind_inflight", {"queue": queue.name}, stats["inflight"]))
+    return result
+
+
+metrics.register_collector(_collect)
+
+
+def drain_all(timeout=10):
+    for queue in _queues:
+        queue.drain(timeout)
+
+
+atexit.register(drain_all)